@@ -1,3 +1,4 @@
+import os
 import json
 import time
 import argparse
@@ -8,7 +9,10 @@ from joblib import Parallel, delayed
 import rule_application as ra
 from grapher import Grapher
 from temporal_walk import store_edges
-from rule_learning import rules_statistics
+from rule_plan import Rule_Plan
+from rule import rules_from_dicts
+from rule_store import Rule_Store, save_rule_store
+from shared_arrays import Shared_Arrays, peak_rss
 from score_functions import score_12
 from score_functions import score_ruleConfidence_timediffReward
 
@@ -34,22 +38,60 @@ dataset_dir = "../data/" + dataset + "/"
 dir_path = "../output/" + dataset + "/"
 data = Grapher(dataset_dir)
 test_data = data.test_idx if (parsed["test_data"] == "test") else data.valid_idx
-rules_dict = json.load(open(dir_path + rules_file))
-rules_dict = {int(k): v for k, v in rules_dict.items()}
+is_store = os.path.isdir(dir_path + rules_file)
+if not is_store:
+    rules_dict = rules_from_dicts(json.load(open(dir_path + rules_file)))
+# The rules, the graph and the index are stored once for all processes
+# (with one process, the folder is only used for the rules and not in shared memory)
+shared_arrays = Shared_Arrays(use_shm=num_processes > 1)
+if is_store:  # Columnar rules from Rule_Learner.save_rules_store
+    rule_store = Rule_Store(dir_path + rules_file)
+else:  # Rules from a JSON file are converted to the columnar format (memory-mapped files)
+    store_dir = os.path.join(shared_arrays.folder, "rules")
+    save_rule_store(rules_dict, store_dir)
+    del rules_dict
+    rule_store = Rule_Store(store_dir)
 print("Rules statistics:")
-rules_statistics(rules_dict)
-rules_dict = ra.filter_rules(
-    rules_dict, min_conf=0, min_body_supp=0, rule_lengths=rule_lengths
+rule_store.statistics()
+# Each process only reads the rules of the head relations of its test queries
+rule_idx = rule_store.select(
+    min_conf=0, min_body_supp=0, rule_lengths=rule_lengths, head_rels=test_data[:, 1]
 )
-print("Rules statistics after pruning:")
-rules_statistics(rules_dict)
+print("Rules statistics after pruning (relations of the test queries):")
+rule_store.statistics(rule_idx)
 learn_edges = store_edges(data.train_idx)
+if num_processes > 1:
+    shared_arrays.share(data)
+    shared_arrays.share(learn_edges)
 
 score_func = score_12
 # score_func = score_ruleConfidence_timediffReward
 
 args = [[0.5, 1]]
 
+
+def get_rules(query_rels):
+    """
+    Get the rules and their compiled bodies for the relations of the test queries.
+    Only the rules of these head relations are read from the rule store.
+
+    Parameters:
+        query_rels (np.ndarray): relations of the test queries
+
+    Returns:
+        rules_dict (dict): rules for each head relation
+        plans_dict (dict): compiled rule bodies for each head relation
+    """
+
+    rule_idx = rule_store.select(
+        min_conf=0, min_body_supp=0, rule_lengths=rule_lengths, head_rels=query_rels
+    )
+    process_rules = rule_store.rules_dict(rule_idx)
+    process_plans = {k: [Rule_Plan(rule) for rule in v] for k, v in process_rules.items()}
+
+    return process_rules, process_plans
+
+
 def apply_rules(i, num_queries):
     """
     Apply rules (multiprocessing possible).
@@ -73,6 +115,7 @@ def apply_rules(i, num_queries):
     else:
         test_queries_idx = range(i * num_queries, len(test_data))
 
+    process_rules, process_plans = get_rules(test_data[test_queries_idx, 1])
     cur_ts = test_data[test_queries_idx[0]][3]
     edges = ra.get_window_edges(data.all_idx, cur_ts, learn_edges, window)
 
@@ -85,16 +128,16 @@ def apply_rules(i, num_queries):
             cur_ts = test_query[3]
             edges = ra.get_window_edges(data.all_idx, cur_ts, learn_edges, window)
 
-        if test_query[1] in rules_dict:
+        if test_query[1] in process_rules:
             dicts_idx = list(range(len(args)))
-            for rule in rules_dict[test_query[1]]:
+            for rule, plan in zip(process_rules[test_query[1]], process_plans[test_query[1]]):
                 walk_edges = ra.match_body_relations(rule, edges, test_query[0])
 
                 if 0 not in [len(x) for x in walk_edges]:
-                    rule_walks = ra.get_walks(rule, walk_edges)
-                    if rule["var_constraints"]:
+                    rule_walks = ra.get_walks(rule, walk_edges, plan)
+                    if rule.var_constraints:
                         rule_walks = ra.check_var_constraints(
-                            rule["var_constraints"], rule_walks
+                            rule.var_constraints, rule_walks
                         )
 
                     if not rule_walks.empty:
@@ -161,14 +204,19 @@ def apply_rules(i, num_queries):
             )
             it_start = time.time()
 
+    print("Process {0}: peak RSS {1} MB".format(i, peak_rss()))
+
     return all_candidates, no_cands_counter
 
 
 start = time.time()
 num_queries = len(test_data) // num_processes
-output = Parallel(n_jobs=num_processes)(
-    delayed(apply_rules)(i, num_queries) for i in range(num_processes)
-)
+try:
+    output = Parallel(n_jobs=num_processes)(
+        delayed(apply_rules)(i, num_queries) for i in range(num_processes)
+    )
+finally:  # Also remove the shared arrays if applying fails or is interrupted
+    shared_arrays.close()
 end = time.time()
 
 final_all_candidates = [dict() for _ in range(len(args))]
@@ -183,13 +231,14 @@ for i in range(num_processes):
 
 total_time = round(end - start, 6)
 print("Application finished in {} seconds.".format(total_time))
+print("Peak RSS of the main process: {} MB".format(peak_rss()))
 print("No candidates: ", final_no_cands_counter, " queries")
 
 for s in range(len(args)):
     score_func_str = score_func.__name__ + str(args[s])
     score_func_str = score_func_str.replace(" ", "")
     ra.save_candidates(
-        rules_file,
+        rules_file[: -len("_store")] + ".json" if is_store else rules_file,
         dir_path,
         final_all_candidates[s],
         rule_lengths,
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+
+from rule import rule_from_dict
+
+
+def checkpoint_dir(output_dir, config):
+    """
+    Get the checkpoint directory of a learning run.
+    The name contains a hash of the configuration, so that only runs with the same
+    data and parameters share their checkpoints.
+
+    Parameters:
+        output_dir (str): output directory of the dataset
+        config (dict): data and parameters that influence the learned rules
+
+    Returns:
+        checkpoint_dir (str): path to the checkpoint directory
+    """
+
+    key = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    checkpoint_dir = "{0}checkpoints/{1}/".format(output_dir, key)
+
+    return checkpoint_dir
+
+
+def checkpoint_file(checkpoint_dir, task):
+    """
+    Get the checkpoint file of a (relation, length) task.
+
+    Parameters:
+        checkpoint_dir (str): checkpoint directory
+        task (dict): task with relation "rel", rule length "length" and "phase"
+
+    Returns:
+        checkpoint_file (str): path to the checkpoint file
+    """
+
+    checkpoint_file = "{0}rel{1}_l{2}_p{3}.json".format(
+        checkpoint_dir, task["rel"], task["length"], task["phase"]
+    )
+
+    return checkpoint_file
+
+
+def save_checkpoint(checkpoint_dir, result):
+    """
+    Save the result of a finished task.
+
+    Parameters:
+        checkpoint_dir (str): checkpoint directory
+        result (dict): the task, its rules, its new state and the number of used walks
+
+    Returns:
+        None
+    """
+
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    task = {k: result["task"][k] for k in ["rel", "length", "budget", "phase"]}
+    state = result["state"]
+    checkpoint = {
+        "task": task,
+        "rules": [rule.to_dict() for rule in result["rules"]],
+        "state": {
+            "found_rules": sorted(state["found_rules"]),
+            "new_rules": state["new_rules"],
+            "delta_stats": [[delta] + stats for delta, stats in state["delta_stats"].items()],
+        },
+        "num_used": result["num_used"],
+        "stopped": result["stopped"],
+        "time": result["time"],
+    }
+    file = checkpoint_file(checkpoint_dir, task)
+    tmp_file = "{0}.{1}.tmp".format(file, os.getpid())
+    with open(tmp_file, "w", encoding="utf-8") as fout:
+        json.dump(checkpoint, fout)
+    os.replace(tmp_file, file)  # Atomic, interrupted runs never leave partial files
+
+
+def load_checkpoint(checkpoint_dir, task):
+    """
+    Load the result of a task that has been finished before.
+
+    Parameters:
+        checkpoint_dir (str): checkpoint directory
+        task (dict): task with relation "rel", rule length "length", number of walks
+                     "budget" and "phase"
+
+    Returns:
+        result (dict): result as in save_checkpoint with the given task,
+                       None if there is no checkpoint for the task
+    """
+
+    file = checkpoint_file(checkpoint_dir, task)
+    if not os.path.exists(file):
+        return None
+    with open(file, encoding="utf-8") as fin:
+        checkpoint = json.load(fin)
+    if checkpoint["task"]["budget"] != task["budget"]:
+        return None
+
+    state = checkpoint["state"]
+    found_rules = set()
+    for key in state["found_rules"]:
+        head_rel, body_rels, var_constraints, order = key
+        found_rules.add(
+            (head_rel, tuple(body_rels), tuple(tuple(x) for x in var_constraints), tuple(order))
+        )
+    delta_stats = {stats[0]: stats[1:] for stats in state["delta_stats"]}
+    result = {
+        "task": task,
+        "rules": [rule_from_dict(rule) for rule in checkpoint["rules"]],
+        "state": {
+            "found_rules": found_rules,
+            "new_rules": state["new_rules"],
+            "delta_stats": delta_stats,
+        },
+        "num_used": checkpoint["num_used"],
+        "stopped": checkpoint["stopped"],
+        "time": checkpoint["time"],
+    }
+
+    return result
+
+
+def remove_checkpoints(checkpoint_dir, relations, rule_lengths):
+    """
+    Remove the checkpoints of the tasks of a finished run, and the checkpoint directory
+    if no other run (e.g., another shard) is still using it.
+
+    Parameters:
+        checkpoint_dir (str): checkpoint directory
+        relations (list): relations of the run
+        rule_lengths (list): rule lengths of the run
+
+    Returns:
+        None
+    """
+
+    for rel in relations:
+        for length in rule_lengths:
+            for phase in [0, 1]:
+                task = {"rel": rel, "length": length, "phase": phase}
+                try:
+                    os.remove(checkpoint_file(checkpoint_dir, task))
+                except FileNotFoundError:
+                    pass
+    try:
+        os.rmdir(checkpoint_dir)
+    except OSError:  # Not empty or already removed
+        pass
@@ -0,0 +1,26 @@
+import os
+import json
+import argparse
+
+from rule import rules_from_dicts, rules_to_dicts
+from rule_store import Rule_Store, save_rule_store
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dataset", "-d", default="", type=str)
+parser.add_argument("--rules", "-r", default="", type=str)
+parsed = vars(parser.parse_args())
+
+dir_path = "../output/" + parsed["dataset"] + "/"
+rules_file = parsed["rules"]
+
+if os.path.isdir(dir_path + rules_file):  # Rule store to JSON
+    rule_store = Rule_Store(dir_path + rules_file)
+    output_file = rules_file[: -len("_store")] + ".json"
+    with open(dir_path + output_file, "w", encoding="utf-8") as fout:
+        json.dump(rules_to_dicts(rule_store.rules_dict()), fout)
+else:  # JSON to rule store
+    rules_dict = rules_from_dicts(json.load(open(dir_path + rules_file)))
+    output_file = rules_file[: -len(".json")] + "_store"
+    save_rule_store(rules_dict, dir_path + output_file)
+print("Saved the rules to " + output_file)
@@ -0,0 +1,319 @@
+import numpy as np
+from collections.abc import Mapping
+
+
+class Edge_Index(Mapping):
+    def __init__(self, quads, key_col, sort_col=None):
+        """
+        Index the quadruples by the values in one column or several columns (CSR format).
+        The quadruples are permuted with a single argsort so that all quadruples with the
+        same key are contiguous, and offsets mark the start of each key's segment.
+        The index can be used like a dict {key: quadruples}, where each value is a
+        view (no copy) of the permuted quadruples.
+
+        Parameters:
+            quads (np.ndarray): indices of quadruples
+            key_col (int or tuple): column of the key (0 - subject, 1 - relation, 2 - object,
+                                    3 - timestamp) or several columns, e.g., (0, 2)
+            sort_col (int): column by which the quadruples are sorted within each segment
+                            If None, the original order of the quadruples is kept.
+
+        Returns:
+            None
+        """
+
+        self.key_col = key_col
+        self.sort_col = sort_col
+        self.key_bases = ()  # Number of values of each key column after the first
+        if isinstance(key_col, tuple):
+            self.key_bases = tuple(
+                int(quads[:, col].max()) + 1 if len(quads) else 1 for col in key_col[1:]
+            )
+        keys = self.combine_keys(quads)
+        if sort_col is None:
+            self.order = np.argsort(keys, kind="stable")
+        else:
+            self.order = np.lexsort((quads[:, sort_col], keys))
+        self.quads = quads[self.order]
+        keys = keys[self.order]
+        # Position in the permuted quadruples for each edge id (row in quads)
+        self.edge_positions = np.empty_like(self.order)
+        self.edge_positions[self.order] = np.arange(len(self.order))
+
+        self.key_values, starts = np.unique(keys, return_index=True)
+        self.offsets = np.append(starts, len(self.quads))
+        self.key_pos = None
+        if not self.key_bases:  # Dense lookup table for single columns
+            max_key = self.key_values[-1] if len(self.key_values) else -1
+            self.key_pos = np.full(max_key + 1, -1, dtype=np.int64)
+            self.key_pos[self.key_values] = np.arange(len(self.key_values))
+
+        if sort_col is not None:
+            # Segment number and sort value in one sorted array for batched binary searches
+            self.sort_values = np.ascontiguousarray(self.quads[:, sort_col])
+            self.sort_base = int(self.sort_values.max()) + 1 if len(self.quads) else 1
+            segment_ids = np.repeat(np.arange(len(self.key_values)), np.diff(self.offsets))
+            self.sorted_keys = segment_ids * self.sort_base + self.sort_values
+
+    def store_log_weights(self, long_segment=32):
+        """
+        Store the logarithm of the cumulative sum of exp(sort value) within each segment,
+        i.e., log_cum_weights[k] = log(sum(exp(sort_values[start:k + 1]))) for the segment
+        start. Used for sampling edges with weights that grow exponentially with time.
+        The short segments are accumulated all at once with a prefix scan in log space:
+        after the pass with step d, each position holds the sum over the last 2 * d
+        positions of its segment (only positions at least d after their segment start take
+        part in a pass). The few long segments are accumulated one by one.
+
+        Parameters:
+            long_segment (int): minimum length of the segments that are accumulated one by one
+
+        Returns:
+            None
+        """
+
+        self.log_cum_weights = self.sort_values.astype(np.float64)
+        seg_lengths = np.diff(self.offsets)
+        for seg in np.flatnonzero(seg_lengths >= long_segment):
+            segment = self.log_cum_weights[self.offsets[seg] : self.offsets[seg + 1]]
+            np.logaddexp.accumulate(segment, out=segment)
+
+        short = np.repeat(seg_lengths < long_segment, seg_lengths)
+        ranks = np.arange(len(self.quads)) - np.repeat(self.offsets[:-1], seg_lengths)
+        pos = np.flatnonzero(short * (ranks > 0))  # Position in the segment >= step
+        step = 1
+        while len(pos):
+            self.log_cum_weights[pos] = np.logaddexp(
+                self.log_cum_weights[pos], self.log_cum_weights[pos - step]
+            )
+            step *= 2
+            pos = pos[ranks[pos] >= step]
+
+    def combine_keys(self, quads):
+        """
+        Get the key of each quadruple.
+
+        Parameters:
+            quads (np.ndarray): indices of quadruples
+
+        Returns:
+            keys (np.ndarray): keys of the quadruples
+        """
+
+        if self.key_bases:
+            return self.multi_key(*[quads[:, col] for col in self.key_col])
+
+        return quads[:, self.key_col]
+
+    def multi_key(self, *values):
+        """
+        Combine the values of several key columns to one key.
+
+        Parameters:
+            values (int or np.ndarray): value(s) of each key column
+
+        Returns:
+            key (int or np.ndarray): combined key(s)
+        """
+
+        key = np.asarray(values[0], dtype=np.int64)
+        valid = True
+        for value, base in zip(values[1:], self.key_bases):
+            key = key * base + value
+            valid = valid * (value < base)
+
+        return np.where(valid, key, -1)  # -1 never matches a key
+
+    def positions(self, keys):
+        """
+        Get the segment numbers of the keys.
+
+        Parameters:
+            keys (np.ndarray): keys (combined keys if the index has several key columns)
+
+        Returns:
+            pos (np.ndarray): segment numbers, -1 if a key does not exist
+        """
+
+        keys = np.asarray(keys, dtype=np.int64)
+        if self.key_pos is not None:
+            valid = (keys >= 0) * (keys < len(self.key_pos))
+            pos = np.where(valid, self.key_pos[np.where(valid, keys, 0)], -1)
+        else:
+            pos = np.searchsorted(self.key_values, keys)
+            pos = np.minimum(pos, len(self.key_values) - 1)
+            valid = (pos >= 0) * (self.key_values[pos] == keys)
+            pos = np.where(valid, pos, -1)
+
+        return pos
+
+    def segment(self, key):
+        """
+        Get the position of the key's segment in the permuted quadruples.
+
+        Parameters:
+            key (int or tuple): key
+
+        Returns:
+            start (int): start of the segment
+            end (int): end of the segment (exclusive)
+        """
+
+        if self.key_bases:
+            pos = self.positions(self.multi_key(*key)) if len(key) == len(self.key_col) else -1
+        else:
+            pos = self.key_pos[key] if 0 <= key < len(self.key_pos) else -1
+        if pos < 0:
+            raise KeyError(key)
+
+        return self.offsets[pos], self.offsets[pos + 1]
+
+    def search(self, key, value, side="left"):
+        """
+        Find the position of a value in the key's segment by binary search.
+        Only available if the index is sorted within the segments (sort_col is set).
+
+        Parameters:
+            key (int or tuple): key
+            value (int): value of the sort column
+            side (str): "left" - first position with a sort value >= value
+                        "right" - first position with a sort value > value
+
+        Returns:
+            start (int): start of the segment
+            pos (int): position of the value in the permuted quadruples
+        """
+
+        start, end = self.segment(key)
+        pos = start + np.searchsorted(self.sort_values[start:end], value, side=side)
+
+        return start, pos
+
+    def search_batch(self, keys, values, side="left"):
+        """
+        Find the positions of values in the segments of several keys at once.
+        Only available if the index is sorted within the segments (sort_col is set).
+
+        Parameters:
+            keys (np.ndarray): keys (combined keys if the index has several key columns)
+            values (np.ndarray): values of the sort column
+            side (str): "left" or "right", see self.search
+
+        Returns:
+            starts (np.ndarray): starts of the segments (0 for keys that do not exist)
+            pos (np.ndarray): positions of the values in the permuted quadruples
+                              (equal to starts for keys that do not exist)
+        """
+
+        seg = self.positions(keys)
+        exists = seg >= 0
+        seg = np.where(exists, seg, 0)
+        values = np.clip(values, 0, self.sort_base)
+        pos = np.searchsorted(self.sorted_keys, seg * self.sort_base + values, side=side)
+        starts = np.where(exists, self.offsets[seg], 0)
+        pos = np.where(exists, np.minimum(pos, self.offsets[seg + 1]), 0)
+
+        return starts, pos
+
+    def search_range_batch(self, keys, lower, upper):
+        """
+        Find the quadruples with lower <= sort value <= upper in the segments of several keys.
+        Only available if the index is sorted within the segments (sort_col is set).
+
+        Parameters:
+            keys (np.ndarray): keys (combined keys if the index has several key columns)
+            lower (np.ndarray): lower bounds of the sort values
+            upper (np.ndarray): upper bounds of the sort values
+
+        Returns:
+            lo (np.ndarray): first positions with a sort value >= lower
+            hi (np.ndarray): first positions with a sort value > upper (hi <= lo if there is none)
+        """
+
+        seg = self.positions(keys)
+        exists = seg >= 0
+        seg = np.where(exists, seg, 0)
+        base = seg * self.sort_base
+        ends = self.offsets[seg + 1]
+        lower = np.clip(lower, 0, self.sort_base)
+        upper = np.clip(upper, 0, self.sort_base)
+        lo = np.searchsorted(self.sorted_keys, base + lower, side="left")
+        hi = np.searchsorted(self.sorted_keys, base + upper, side="right")
+        lo = np.where(exists, np.minimum(lo, ends), 0)
+        hi = np.where(exists, np.minimum(hi, ends), 0)
+
+        return lo, hi
+
+    def count_greater(self, keys, values):
+        """
+        Count the quadruples with a sort value > value in the segments of several keys.
+        Only available if the index is sorted within the segments (sort_col is set).
+
+        Parameters:
+            keys (np.ndarray): keys (combined keys if the index has several key columns)
+            values (np.ndarray): values of the sort column
+
+        Returns:
+            counts (np.ndarray): number of quadruples (0 for keys that do not exist)
+        """
+
+        seg = self.positions(keys)
+        exists = seg >= 0
+        seg = np.where(exists, seg, 0)
+        values = np.clip(values, 0, self.sort_base)
+        pos = np.searchsorted(self.sorted_keys, seg * self.sort_base + values, side="right")
+        ends = self.offsets[seg + 1]
+        counts = np.where(exists, ends - np.minimum(pos, ends), 0)
+
+        return counts
+
+    def __getitem__(self, key):
+        start, end = self.segment(key)
+        return self.quads[start:end]
+
+    def __contains__(self, key):
+        try:
+            self.segment(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        if self.key_bases:
+            columns = []
+            rest = self.key_values
+            for base in reversed(self.key_bases):
+                rest, value = np.divmod(rest, base)
+                columns.insert(0, value.tolist())
+            return iter(zip(rest.tolist(), *columns))
+        return iter(self.key_values.tolist())
+
+    def __len__(self):
+        return len(self.key_values)
+
+
+def search_ranges(values, lo, hi, targets):
+    """
+    Binary search in several sorted ranges of an array at once.
+
+    Parameters:
+        values (np.ndarray): array that is sorted within each range
+        lo (np.ndarray): starts of the ranges
+        hi (np.ndarray): ends of the ranges (exclusive)
+        targets (np.ndarray): value to search for in each range
+
+    Returns:
+        pos (np.ndarray): first position in each range with a value > target (hi if there is none)
+    """
+
+    lo = np.array(lo, dtype=np.int64)
+    hi = np.array(hi, dtype=np.int64)
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        go_right = values[np.where(active, mid, 0)] <= targets
+        lo = np.where(active * go_right, mid + 1, lo)
+        hi = np.where(active * ~go_right, mid, hi)
+        active = lo < hi
+
+    return lo
@@ -1,21 +1,31 @@
+import os
+import csv
 import json
+import hashlib
 import numpy as np
+import pandas as pd
+
+
+CACHE_VERSION = 1  # Increase if the format of the cached arrays changes
 
 
 class Grapher(object):
-    def __init__(self, dataset_dir):
+    def __init__(self, dataset_dir, use_cache=True):
         """
         Store information about the graph (train/valid/test set).
         Add corresponding inverse quadruples to the data.
 
         Parameters:
             dataset_dir (str): path to the graph dataset directory
+            use_cache (bool): load/store the index arrays from/in dataset_dir + "cache/"
 
         Returns:
             None
         """
 
         self.dataset_dir = dataset_dir
+        self.cache_dir = dataset_dir + "cache/"
+        self.use_cache = use_cache
         self.entity2id = json.load(open(dataset_dir + "entity2id.json"))
         self.relation2id_old = json.load(open(dataset_dir + "relation2id.json"))
         self.relation2id = self.relation2id_old.copy()
@@ -46,6 +56,8 @@ class Grapher(object):
         """
         Store the quadruples from the file as indices.
         The quadruples in the file should be in the format "subject\trelation\tobject\ttimestamp\n".
+        If caching is enabled, the indices are memory-mapped from the cache and only
+        parsed (and cached) if the file or one of the id mappings has changed.
 
         Parameters:
             file (str): file name
@@ -54,50 +66,101 @@ class Grapher(object):
             store_idx (np.ndarray): indices of quadruples
         """
 
-        with open(self.dataset_dir + file, "r", encoding="utf-8") as f:
-            quads = f.readlines()
-        store = self.split_quads(quads)
-        store_idx = self.map_to_idx(store)
+        if self.use_cache:
+            cache_file = self.cache_file(file)
+            if os.path.exists(cache_file):
+                return np.asarray(np.load(cache_file, mmap_mode="r"))
+
+        quads = self.read_quads(file)
+        store_idx = self.map_to_idx(quads)
         store_idx = self.add_inverses(store_idx)
 
+        if self.use_cache:
+            self.save_cache(file, cache_file, store_idx)
+
         return store_idx
 
-    def split_quads(self, quads):
+    def add_timestamps(self, file):
         """
-        Split quadruples into a list of strings.
+        Add the unknown timestamps of the file (e.g., new days) to the timestamp ids and
+        save them in ts2id.json. The new timestamps get the next ids in time order, so
+        they must be later than all known timestamps to keep the ids in time order.
 
         Parameters:
-            quads (list): list of quadruples
-                          Each quadruple has the form "subject\trelation\tobject\ttimestamp\n".
+            file (str): file name
 
         Returns:
-            split_q (list): list of quadruples
-                            Each quadruple has the form [subject, relation, object, timestamp].
+            new_ts (list): new timestamps in time order
         """
 
-        split_q = []
-        for quad in quads:
-            split_q.append(quad[:-1].split("\t"))
+        new_ts = set(self.read_quads(file)[3]) - set(self.ts2id)
+        new_ts = sorted(new_ts, key=timestamp_key)
+        if not new_ts:
+            return new_ts
+        last_id = max(self.id2ts)
+        if timestamp_key(new_ts[0]) < timestamp_key(self.id2ts[last_id]):
+            raise ValueError(
+                "The timestamp {0} in {1} is unknown and before the last known timestamp {2}, "
+                "only later timestamps can be added.".format(new_ts[0], file, self.id2ts[last_id])
+            )
+        for num, ts in enumerate(new_ts, start=last_id + 1):
+            self.ts2id[ts] = num
+            self.id2ts[num] = ts
+
+        ts_file = self.dataset_dir + "ts2id.json"
+        tmp_file = "{0}.{1}.tmp".format(ts_file, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as fout:
+            json.dump(self.ts2id, fout)
+        os.replace(tmp_file, ts_file)
+
+        return new_ts
+
+    def read_quads(self, file):
+        """
+        Read the quadruples from the file as strings.
 
-        return split_q
+        Parameters:
+            file (str): file name
+
+        Returns:
+            quads (pd.DataFrame): quadruples with the columns subject, relation, object, timestamp
+        """
+
+        quads = pd.read_csv(
+            self.dataset_dir + file,
+            sep="\t",
+            header=None,
+            usecols=[0, 1, 2, 3],
+            dtype=str,
+            quoting=csv.QUOTE_NONE,
+            keep_default_na=False,
+            na_filter=False,
+            encoding="utf-8",
+        )
+
+        return quads
 
     def map_to_idx(self, quads):
         """
         Map quadruples to their indices.
 
         Parameters:
-            quads (list): list of quadruples
-                          Each quadruple has the form [subject, relation, object, timestamp].
+            quads (pd.DataFrame): quadruples from self.read_quads
 
         Returns:
             quads (np.ndarray): indices of quadruples
         """
 
-        subs = [self.entity2id[x[0]] for x in quads]
-        rels = [self.relation2id[x[1]] for x in quads]
-        objs = [self.entity2id[x[2]] for x in quads]
-        tss = [self.ts2id[x[3]] for x in quads]
-        quads = np.column_stack((subs, rels, objs, tss))
+        mappings = [self.entity2id, self.relation2id, self.entity2id, self.ts2id]
+        names = ["entity", "relation", "entity", "timestamp"]
+        columns = []
+        for col, mapping in enumerate(mappings):
+            idx = quads[col].map(mapping)
+            if idx.isna().any():
+                value = quads[col][idx.isna()].iloc[0]
+                raise KeyError("unknown {0}: {1}".format(names[col], value))
+            columns.append(idx.to_numpy(dtype=np.int64))
+        quads = np.column_stack(columns)
 
         return quads
 
@@ -111,11 +174,79 @@ class Grapher(object):
         Returns:
             quads_idx (np.ndarray): indices of quadruples along with the indices of their inverses
         """
+
+        num_relations = len(self.relation2id_old)
         subs = quads_idx[:, 2]
-        rels = [self.inv_relation_id[x] for x in quads_idx[:, 1]]
+        rels = quads_idx[:, 1]
+        rels = np.where(rels < num_relations, rels + num_relations, rels - num_relations)
         objs = quads_idx[:, 0]
         tss = quads_idx[:, 3]
         inv_quads_idx = np.column_stack((subs, rels, objs, tss))
         quads_idx = np.vstack((quads_idx, inv_quads_idx))
 
         return quads_idx
+
+    def cache_file(self, file):
+        """
+        Get the cache file for the quadruples of a file.
+        The name contains a hash of the cache version and the size and modification time
+        of the file and the id mappings, so that changed sources are never read from the cache.
+
+        Parameters:
+            file (str): file name
+
+        Returns:
+            cache_file (str): path to the cache file
+        """
+
+        sources = [file, "entity2id.json", "relation2id.json", "ts2id.json"]
+        key = [CACHE_VERSION]
+        for source in sources:
+            stat = os.stat(self.dataset_dir + source)
+            key.append([source, stat.st_size, stat.st_mtime_ns])
+        key = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+        cache_file = "{0}{1}_{2}.npy".format(self.cache_dir, file[:-4], key)
+
+        return cache_file
+
+    def save_cache(self, file, cache_file, store_idx):
+        """
+        Save the quadruples of a file in the cache and remove outdated cache files.
+
+        Parameters:
+            file (str): file name
+            cache_file (str): path to the cache file
+            store_idx (np.ndarray): indices of quadruples
+
+        Returns:
+            None
+        """
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        prefix = file[:-4] + "_"
+        for old_file in os.listdir(self.cache_dir):
+            if old_file.startswith(prefix) and old_file.endswith(".npy"):
+                try:
+                    os.remove(self.cache_dir + old_file)
+                except FileNotFoundError:  # Removed by a parallel run
+                    pass
+        tmp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+        with open(tmp_file, "wb") as fout:
+            np.save(fout, store_idx)
+        os.replace(tmp_file, cache_file)  # Atomic, parallel runs never read partial files
+
+
+def timestamp_key(ts):
+    """
+    Get a key that sorts timestamps in time order, numerically for integer timestamps
+    and as strings otherwise (e.g., ISO dates).
+
+    Parameters:
+        ts (str): timestamp
+
+    Returns:
+        key (tuple): sort key
+    """
+
+    return (0, int(ts), "") if ts.lstrip("-").isdigit() else (1, 0, ts)
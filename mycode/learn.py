@@ -1,5 +1,8 @@
+import os
 import time
+import queue
 import argparse
+import multiprocessing
 import json
 import numpy as np
 from datetime import datetime
@@ -8,6 +11,9 @@ from joblib import Parallel, delayed
 from grapher import Grapher
 from temporal_walk import Temporal_Walk
 from rule_learning import Rule_Learner, rules_statistics
+from shared_arrays import Shared_Arrays, peak_rss
+from checkpoint import checkpoint_dir, save_checkpoint, load_checkpoint, remove_checkpoints
+from walk_log import Walk_Log
 
 
 parser = argparse.ArgumentParser()
@@ -17,6 +23,22 @@ parser.add_argument("--num_walks", "-n", default="100", type=int)
 parser.add_argument("--transition_distr", default="unif", type=str)
 parser.add_argument("--num_processes", "-p", default=1, type=int)
 parser.add_argument("--seed", "-s", default=None, type=int)
+parser.add_argument("--batch_size", "-b", default=0, type=int)  # 0: sample walks one by one
+parser.add_argument("--cycle_check", default="none", type=str, choices=["none", "reject", "steer"])
+parser.add_argument("--dead_end_cache", default=100000, type=int)  # 0: no cache
+parser.add_argument("--adaptive", action="store_true")
+parser.add_argument("--stop_window", default=200, type=int)
+parser.add_argument("--min_rule_rate", default=0.01, type=float)
+parser.add_argument("--confidence", default="sample", type=str, choices=["sample", "exact", "adaptive"])
+parser.add_argument("--max_groundings", default=1000000, type=int)
+parser.add_argument("--conf_tolerance", default=0.05, type=float)
+parser.add_argument("--min_conf", default=0.0, type=float)
+parser.add_argument("--body_cache", default=256, type=int)  # MB for all processes, 0: no cache
+parser.add_argument("--checkpoint", action="store_true")
+parser.add_argument("--resume", action="store_true")
+parser.add_argument("--shard", default=None, type=str)  # "i/N": learn the i-th of N shards
+parser.add_argument("--window", default=0, type=int)  # Most recent timestamps, 0: all
+parser.add_argument("--record_walks", default=None, type=str)  # Name of the walk log
 parsed = vars(parser.parse_args())
 
 dataset = parsed["dataset"]
@@ -26,126 +48,526 @@ num_walks = parsed["num_walks"]
 transition_distr = parsed["transition_distr"]
 num_processes = parsed["num_processes"]
 seed = parsed["seed"]
+batch_size = parsed["batch_size"]
+cycle_check = parsed["cycle_check"]
+dead_end_cache = parsed["dead_end_cache"]
+adaptive = parsed["adaptive"]
+stop_window = parsed["stop_window"]
+min_rule_rate = parsed["min_rule_rate"]
+confidence_mode = parsed["confidence"]
+max_groundings = parsed["max_groundings"]
+conf_tolerance = parsed["conf_tolerance"]
+min_conf = parsed["min_conf"]
+body_cache = parsed["body_cache"]
+resume = parsed["resume"]
+checkpoint = parsed["checkpoint"] or resume
+window = parsed["window"]
+shard, num_shards = None, None
+if parsed["shard"] is not None:
+    try:
+        shard, num_shards = [int(x) for x in parsed["shard"].split("/")]
+    except ValueError:
+        parser.error("--shard must have the format i/N")
+    if not 0 <= shard < num_shards:
+        parser.error("--shard i/N requires 0 <= i < N")
 
 dataset_dir = "../data/" + dataset + "/"
 data = Grapher(dataset_dir)
-temporal_walk = Temporal_Walk(data.train_idx, data.inv_relation_id, transition_distr)
-rl = Rule_Learner(temporal_walk.edges, data.id2relation, data.inv_relation_id, dataset)
+temporal_walk = Temporal_Walk(
+    data.train_idx, data.inv_relation_id, transition_distr, cycle_check, dead_end_cache
+)
+min_ts = 0
+if window:  # Only learn from the edges of the most recent timestamps
+    timestamps = np.unique(data.train_idx[:, 3])
+    min_ts = int(timestamps[-min(window, len(timestamps))])
+    temporal_walk.set_window(min_ts)
+rl = Rule_Learner(
+    temporal_walk.start_edges,  # Sorted by time within each relation with a window
+    data.id2relation,
+    data.inv_relation_id,
+    dataset,
+    confidence_mode,
+    max_groundings,
+    conf_tolerance,
+    min_conf,
+    body_cache * 2 ** 20 // num_processes,  # Each process has its own cache
+    seed,
+    min_ts,
+)
 all_relations = sorted(temporal_walk.edges)  # Learn for all relations
+checkpoints = None
+if checkpoint:  # Everything that influences the rules of a task except the task itself
+    config = {
+        "train": os.path.basename(data.cache_file("train.txt")),
+        "num_walks": num_walks,
+        "transition_distr": transition_distr,
+        "seed": seed,
+        "batch_size": batch_size,
+        "cycle_check": cycle_check,
+        "dead_end_cache": dead_end_cache,
+        "adaptive": [adaptive, stop_window, min_rule_rate] if adaptive else False,
+        "confidence": [confidence_mode, max_groundings, conf_tolerance, min_conf],
+    }
+    if window:
+        config["window"] = window
+    checkpoints = checkpoint_dir(rl.output_dir, config)
+    print("Checkpoints: " + checkpoints)
+walk_log = None
+if parsed["record_walks"] is not None:  # Everything that is needed to replay the walks
+    walk_log = Walk_Log(rl.output_dir + parsed["record_walks"] + "/")
+    walk_log.save_meta(
+        {
+            "train": os.path.basename(data.cache_file("train.txt")),
+            "rule_lengths": rule_lengths,
+            "num_walks": num_walks,
+            "transition_distr": transition_distr,
+            "seed": seed,
+            "min_ts": min_ts,
+        }
+    )
+    print("Walk log: " + walk_log.log_dir)
+shared_arrays = None
+if num_processes > 1:  # Store the graph and the indexes once for all processes
+    rl.build_indexes()
+    shared_arrays = Shared_Arrays()
+    shared_arrays.share(temporal_walk)
+    shared_arrays.share(rl)
+    print(
+        "Shared {0} arrays ({1} MB) between the processes.".format(
+            shared_arrays.num_arrays, shared_arrays.num_bytes // 2 ** 20
+        )
+    )
 dt_save_delta_stats = datetime.now()
 dt_save_delta_stats = dt_save_delta_stats.strftime("%Y%m%d%H%M%S")
 
-def learn_rules(i, num_relations):
+
+def shard_relations(edges, shard, num_shards):
+    """
+    Assign the relations deterministically to shards with about the same number of edges
+    (the largest relation to the shard with the fewest edges so far) and get the
+    relations of one shard.
+
+    Parameters:
+        edges (dict): edges for each relation
+        shard (int): shard number
+        num_shards (int): number of shards
+
+    Returns:
+        shard_relations (list): relations of the shard (sorted)
+    """
+
+    shard_edges = [0] * num_shards
+    shard_relations = []
+    for rel in sorted(edges, key=lambda rel: (-len(edges[rel]), rel)):
+        target = shard_edges.index(min(shard_edges))
+        shard_edges[target] += len(edges[rel])
+        if target == shard:
+            shard_relations.append(rel)
+
+    return sorted(shard_relations)
+
+
+if shard is not None:
+    all_relations = shard_relations(temporal_walk.edges, shard, num_shards)
+    print("Shard {0}/{1}: {2} relations".format(shard, num_shards, len(all_relations)))
+if window:
+    all_relations = [rel for rel in all_relations if temporal_walk.num_start_edges(rel)]
+    print(
+        "Window: timestamps from {0} on, {1} relations with edges".format(
+            min_ts, len(all_relations)
+        )
+    )
+
+
+def delta_probabilities(delta_stats):
+    """
+    Calculate the probabilities of the deltas with the UCB values of their walk statistics.
+
+    Parameters:
+        delta_stats (dict): number of successful walks and number of all walks for each delta
+
+    Returns:
+        probabilities (dict): probability for each delta
+    """
+
+    N = sum([stats[1] for stats in delta_stats.values()])
+    ucb_values = {delta: (stats[0] / stats[1] if stats[1] > 0 else 0) + 1 * np.sqrt(
+        np.log(N) / (stats[1] if stats[1] > 0 else 1)) for delta, stats in
+                  delta_stats.items()}
+    total_ucb = sum(ucb_values.values())
+    probabilities = {delta: ucb / total_ucb for delta, ucb in ucb_values.items()}
+
+    return probabilities
+
+
+def sample_rule_walks(rel, length, num, delta_stats, first_walk=0):
+    """
+    Sample walks for a relation and rule length and create the rules.
+    If batch_size is set, the walks are sampled in batches and the delta probabilities
+    are updated after each batch. The successful walks are added to the walk log.
+
+    Parameters:
+        rel (int): relation index
+        length (int): rule length
+        num (int): number of walks
+        delta_stats (dict): number of successful walks and number of all walks for each delta
+        first_walk (int): number of the first walk among the walks of the relation and length
+
+    Returns:
+        new_rules (list): if a new rule has been found for each walk
+    """
+
+    new_rules = []
+    if not batch_size:
+        for walk_num in range(first_walk, first_walk + num):
+            probabilities = delta_probabilities(delta_stats)
+            delta_now = np.random.choice(list(probabilities.keys()), p=list(probabilities.values()))
+            delta_list = delta_stats.keys()
+            walk_successful, walk = temporal_walk.sample_walk(length + 1, rel, delta_now, delta_list)
+            delta_stats[delta_now][1] += 1
+            num_found_rules = len(rl.found_rules)
+            if walk_successful:
+                if walk_log is not None:  # Before create_rule, which reorders the timestamps
+                    walk_log.add([walk_num], [walk])
+                rl.create_rule(walk)
+                delta_stats[delta_now][0] += 1
+            new_rules.append(len(rl.found_rules) > num_found_rules)
+        return new_rules
+
+    for batch_start in range(0, num, batch_size):
+        num_batch_walks = min(batch_size, num - batch_start)
+        probabilities = delta_probabilities(delta_stats)
+        deltas = np.random.choice(
+            list(probabilities.keys()), num_batch_walks, p=list(probabilities.values())
+        )
+        walks_successful, walks = temporal_walk.sample_walks(
+            length + 1, rel, deltas, delta_stats.keys()
+        )
+        for delta in delta_stats:
+            delta_mask = deltas == delta
+            delta_stats[delta][0] += int(np.sum(walks_successful[delta_mask]))
+            delta_stats[delta][1] += int(np.sum(delta_mask))
+        new_rules += [False] * (num_batch_walks - len(walks))
+        if walk_log is not None:
+            walk_nums = first_walk + batch_start + np.flatnonzero(walks_successful)
+            walk_log.add(walk_nums.tolist(), walks)
+        for walk in walks:
+            num_found_rules = len(rl.found_rules)
+            rl.create_rule(walk)
+            new_rules.append(len(rl.found_rules) > num_found_rules)
+
+    return new_rules
+
+
+def learn_pair(rel, length, budget, delta_stats, new_rules):
+    """
+    Learn rules for a relation and rule length with a budget of walks.
+    In adaptive mode, stop as soon as less than min_rule_rate new rules per walk
+    have been found in the last stop_window walks.
+
+    Parameters:
+        rel (int): relation index
+        length (int): rule length
+        budget (int): maximum number of walks
+        delta_stats (dict): number of successful walks and number of all walks for each delta
+        new_rules (list): if a new rule has been found for each previous walk of the pair
+                          (updated in place)
+
+    Returns:
+        num_used (int): number of sampled walks
+        stopped (bool): if the pair stopped early
+    """
+
+    if not adaptive:
+        new_rules += sample_rule_walks(rel, length, budget, delta_stats, len(new_rules))
+        return budget, False
+
+    num_used = 0
+    while num_used < budget:
+        num = min(batch_size or 1, budget - num_used)
+        new_rules += sample_rule_walks(rel, length, num, delta_stats, len(new_rules))
+        num_used += num
+        if len(new_rules) >= stop_window:
+            if sum(new_rules[-stop_window:]) < min_rule_rate * stop_window:
+                return num_used, True
+
+    return num_used, False
+
+
+def task_seed(rel, length, phase):
+    """
+    Derive the random seed of a task from the global seed, so that the results
+    do not depend on the number of processes or on the order of the tasks.
+
+    Parameters:
+        rel (int): relation index
+        length (int): rule length
+        phase (int): 0 - first walks, 1 - additional walks in adaptive mode
+
+    Returns:
+        task_seed (int): random seed
+    """
+
+    seed_seq = np.random.SeedSequence([seed, int(rel), int(length), phase])
+
+    return int(seed_seq.generate_state(1)[0])
+
+
+def learn_task(i, task):
+    """
+    Learn rules for a relation and rule length (one task of the scheduler).
+
+    Parameters:
+        i (int): process number
+        task (dict): relation "rel", rule length "length", number of walks "budget",
+                     "phase" (see task_seed) and the "state" of the previous phase (or None)
+
+    Returns:
+        result (dict): the task, its rules, its new state and the number of used walks
+    """
+
+    rel, length = task["rel"], task["length"]
+    if seed is not None:
+        np.random.seed(task_seed(rel, length, task["phase"]))
+    if task["state"] is None:
+        delta_stats = {0.25: [1, 1], 0.5: [1, 1], 0.75: [1, 1], 1: [1, 1]}
+        state = {"found_rules": set(), "new_rules": [], "delta_stats": delta_stats}
+    else:
+        state = task["state"]
+    # The rules of a task all have the head relation rel and length rule atoms in the body
+    rl.found_rules = state["found_rules"]
+    rl.rules_dict = dict()
+
+    it_start = time.time()
+    walks_before = temporal_walk.num_walks
+    successful_before = temporal_walk.num_successful_walks
+    lookups_before = temporal_walk.dead_end_lookups
+    hits_before = temporal_walk.dead_end_hits
+    body_lookups_before = rl.body_cache_lookups
+    body_hits_before = rl.body_cache_hits
+    num_used, stopped = learn_pair(
+        rel, length, task["budget"], state["delta_stats"], state["new_rules"]
+    )
+    it_end = time.time()
+    it_time = round(it_end - it_start, 6)
+    rules = rl.rules_dict.get(rel, [])
+    success_rate = (temporal_walk.num_successful_walks - successful_before) / max(
+        temporal_walk.num_walks - walks_before, 1
+    )
+    print(
+        "Process {0}: relation {1}, length {2}: {3} sec, {4} rules, {5}% successful walks".format(
+            i, rel, length, it_time, len(rules), round(100 * success_rate, 2)
+        )
+    )
+    if dead_end_cache and not batch_size:
+        hit_rate = (temporal_walk.dead_end_hits - hits_before) / max(
+            temporal_walk.dead_end_lookups - lookups_before, 1
+        )
+        print(
+            "Process {0}: dead-end cache: {1}% hits, {2} states, {3} KB".format(
+                i,
+                round(100 * hit_rate, 2),
+                len(temporal_walk.dead_ends),
+                temporal_walk.dead_end_cache_memory() // 1024,
+            )
+        )
+    if body_cache:
+        body_lookups = rl.body_cache_lookups - body_lookups_before
+        body_hits = rl.body_cache_hits - body_hits_before
+        print(
+            "Process {0}: body cache: {1} hits, {2} misses, {3} bodies, {4} KB".format(
+                i,
+                body_hits,
+                body_lookups - body_hits,
+                len(rl.body_cache),
+                rl.body_cache_bytes // 1024,
+            )
+        )
+    if stopped:
+        print(
+            "Process {0}: relation {1}, length {2}: stopped after {3} walks".format(
+                i, rel, length, len(state["new_rules"])
+            )
+        )
+
+    result = {
+        "task": task,
+        "rules": rules,
+        "state": state,
+        "num_used": num_used,
+        "stopped": stopped,
+        "time": it_time,
+    }
+    if walk_log is not None:
+        walk_log.flush(rel, length, task["phase"])
+    if checkpoints is not None:
+        save_checkpoint(checkpoints, result)
+
+    return result
+
+
+def learn_rules(i, tasks):
     """
     Learn rules (multiprocessing possible).
+    Take tasks from the shared queue until it is empty, so that all processes stay busy.
 
     Parameters:
         i (int): process number
-        num_relations (int): minimum number of relations for each process
+        tasks (queue.Queue): tasks, largest first
 
     Returns:
-        rl.rules_dict (dict): rules dictionary
+        results (list): results of the tasks learned by this process
+        busy_time (float): time spent on the tasks
+        peak_rss (int): peak resident set size of the process in MB
     """
 
-    if seed:
-        np.random.seed(seed)
+    results = []
+    busy_time = 0
+    while True:
+        try:
+            task = tasks.get_nowait()
+        except queue.Empty:
+            break
+        results.append(learn_task(i, task))
+        busy_time += results[-1]["time"]
+    print(
+        "Process {0}: {1} tasks, {2}/{3} successful walks".format(
+            i, len(results), temporal_walk.num_successful_walks, temporal_walk.num_walks
+        )
+    )
 
-    num_rest_relations = len(all_relations) - (i + 1) * num_relations
-    if num_rest_relations >= num_relations:
-        relations_idx = range(i * num_relations, (i + 1) * num_relations)
-    else:
-        relations_idx = range(i * num_relations, len(all_relations))
+    return results, busy_time, peak_rss()
 
-    num_rules = [0]
-    delta_stats = {0.25: [1, 1], 0.5: [1, 1], 0.75: [1, 1], 1: [1, 1]}
 
-    for k in relations_idx:
-        rel = all_relations[k]
-        for length in rule_lengths:
-            it_start = time.time()
-            for _ in range(num_walks):
-                N = sum([stats[1] for stats in delta_stats.values()])
-                ucb_values = {delta: (stats[0] / stats[1] if stats[1] > 0 else 0) + 1 * np.sqrt(
-                    np.log(N) / (stats[1] if stats[1] > 0 else 1)) for delta, stats in
-                              delta_stats.items()}
-                total_ucb = sum(ucb_values.values())
-                probabilities = {delta: ucb / total_ucb for delta, ucb in ucb_values.items()}
-                delta_now = np.random.choice(list(probabilities.keys()), p=list(probabilities.values()))
-                delta_list = delta_stats.keys()
-                walk_successful, walk = temporal_walk.sample_walk(length + 1, rel, delta_now, delta_list)
-                delta_stats[delta_now][1] += 1
-                if walk_successful:
-                    rl.create_rule(walk)
-                    delta_stats[delta_now][0] += 1
-            it_end = time.time()
-            it_time = round(it_end - it_start, 6)
-            num_rules.append(sum([len(v) for k, v in rl.rules_dict.items()]) // 2)
-            num_new_rules = num_rules[-1] - num_rules[-2]
-            print(
-                "Process {0}: relation {1}/{2}, length {3}: {4} sec, {5} rules".format(
-                    i,
-                    k - relations_idx[0] + 1,
-                    len(relations_idx),
-                    length,
-                    it_time,
-                    num_new_rules,
-                )
+def run_tasks(tasks):
+    """
+    Run the tasks with num_processes processes that take the next task as soon as
+    they are free, and show the utilization of each process.
+    With --resume, the tasks with a checkpoint are loaded instead.
+
+    Parameters:
+        tasks (list): tasks, largest first
+
+    Returns:
+        results (list): results of the tasks (in the order of the tasks)
+    """
+
+    finished = []
+    with multiprocessing.Manager() as manager:  # Shut down once the tasks are done
+        task_queue = manager.Queue()
+        for num, task in enumerate(tasks):
+            task["num"] = num
+            result = load_checkpoint(checkpoints, task) if resume else None
+            if result is not None:
+                finished.append(result)
+            else:
+                task_queue.put(task)
+        if resume:
+            print("Resumed {0} of {1} tasks from checkpoints.".format(len(finished), len(tasks)))
+
+        start = time.time()
+        output = Parallel(n_jobs=num_processes)(
+            delayed(learn_rules)(i, task_queue) for i in range(num_processes)
+        )
+    wall_time = max(time.time() - start, 1e-6)
+    for i, (process_results, busy_time, process_rss) in enumerate(output):
+        print(
+            "Process {0}: {1} tasks, busy {2} of {3} sec ({4}% utilization), peak RSS {5} MB".format(
+                i,
+                len(process_results),
+                round(busy_time, 2),
+                round(wall_time, 2),
+                round(100 * busy_time / wall_time, 2),
+                process_rss,
             )
-        delta_stats = {delta: [1, 1] for delta in delta_stats}
-    return rl.rules_dict
+        )
+    results = sorted(
+        finished + [result for process_results, _, _ in output for result in process_results],
+        key=lambda result: result["task"]["num"],
+    )
+
+    return results
+
+
+def learn_all_rules():
+    """
+    Learn the rules for all relations and rule lengths.
+    The (relation, length) tasks are scheduled dynamically, the largest relations first.
+    In adaptive mode, the walks saved by tasks that stopped early are distributed evenly
+    among the tasks that did not stop and learned in a second phase.
+
+    Parameters:
+        None
+
+    Returns:
+        all_rules (dict): rules for each head relation
+    """
+
+    tasks = []
+    for rel in all_relations:
+        for length in rule_lengths:
+            task = {"rel": rel, "length": length, "budget": num_walks, "phase": 0, "state": None}
+            tasks.append(task)
+    tasks.sort(key=lambda task: (-temporal_walk.num_start_edges(task["rel"]), -task["length"]))
+    results = run_tasks(tasks)
+
+    if adaptive:
+        saved_walks = sum([num_walks - result["num_used"] for result in results])
+        yielding = [result for result in results if not result["stopped"]]
+        if saved_walks and yielding:
+            # Same order as in the first phase, independent of the number of processes
+            extra_tasks = []
+            for num, result in enumerate(yielding):
+                budget = saved_walks // len(yielding) + (num < saved_walks % len(yielding))
+                if budget:
+                    task = dict(result["task"], budget=budget, phase=1, state=result["state"])
+                    extra_tasks.append(task)
+            results += run_tasks(extra_tasks)
+
+    all_rules = dict()
+    results.sort(key=lambda result: (result["task"]["rel"], result["task"]["length"]))
+    for result in results:
+        if result["rules"]:
+            all_rules.setdefault(result["task"]["rel"], []).extend(result["rules"])
+
+    return all_rules
 
 
 start = time.time()
-num_relations = len(all_relations) // num_processes
-output = Parallel(n_jobs=num_processes)(
-    delayed(learn_rules)(i, num_relations) for i in range(num_processes)
-)
+try:
+    all_rules = learn_all_rules()
+finally:  # Also remove the shared arrays if learning fails or is interrupted
+    if shared_arrays is not None:
+        shared_arrays.close()
 end = time.time()
 
-all_rules = output[0]
-for i in range(1, num_processes):
-    all_rules.update(output[i])
-
 
 total_time = round(end - start, 6)
 print("Learning finished in {} seconds.".format(total_time))
+print("Peak RSS of the main process: {} MB".format(peak_rss()))
 
 rl.rules_dict = all_rules
 
-count_temporal_patterns = {}
-count_temporal_patterns["0"] = 0
-count_temporal_patterns["01"] = 0
-count_temporal_patterns["10"] = 0
-count_temporal_patterns["012"] = 0
-count_temporal_patterns["021"] = 0
-count_temporal_patterns["102"] = 0
-count_temporal_patterns["120"] = 0
-count_temporal_patterns["201"] = 0
-count_temporal_patterns["210"] = 0
+count_temporal_patterns = {
+    pattern: 0 for pattern in ["0", "01", "10", "012", "021", "102", "120", "201", "210"]
+}
 for head_rel, rules in rl.rules_dict.items():
     for rule in rules:
-        if rule['body_timestamp_order'] == [0]:
-            count_temporal_patterns["0"] += 1
-        elif rule['body_timestamp_order'] == [0, 1]:
-            count_temporal_patterns["01"] += 1
-        elif rule['body_timestamp_order'] == [1, 0]:
-            count_temporal_patterns["10"] += 1
-        elif rule['body_timestamp_order'] == [0, 1, 2]:
-            count_temporal_patterns["012"] += 1
-        elif rule['body_timestamp_order'] == [0, 2, 1]:
-            count_temporal_patterns["021"] += 1
-        elif rule['body_timestamp_order'] == [1, 0, 2]:
-            count_temporal_patterns["102"] += 1
-        elif rule['body_timestamp_order'] == [1, 2, 0]:
-            count_temporal_patterns["120"] += 1
-        elif rule['body_timestamp_order'] == [2, 0, 1]:
-            count_temporal_patterns["201"] += 1
-        elif rule['body_timestamp_order'] == [2, 1, 0]:
-            count_temporal_patterns["210"] += 1
+        pattern = "".join(str(x) for x in rule.body_timestamp_order)
+        count_temporal_patterns[pattern] = count_temporal_patterns.get(pattern, 0) + 1
 print("Count temporal patterns: " + str(count_temporal_patterns))
 rl.sort_rules_dict()
 dt = datetime.now()
 dt = dt.strftime("%Y%m%d%H%M%S")
-rl.save_rules(dt, rule_lengths, num_walks, transition_distr, seed)
-rl.save_rules_verbalized(dt, rule_lengths, num_walks, transition_distr, seed)
+if shard is None:
+    rl.save_rules(dt, rule_lengths, num_walks, transition_distr, seed)
+    rl.save_rules_store(dt, rule_lengths, num_walks, transition_distr, seed)
+    rl.save_rules_verbalized(dt, rule_lengths, num_walks, transition_distr, seed)
+else:
+    filename = rl.save_rules_shard(
+        dt, rule_lengths, num_walks, transition_distr, seed, shard, num_shards, all_relations
+    )
+    print("Saved shard {0}/{1} to {2}".format(shard, num_shards, filename))
+if checkpoints is not None:  # The saved rules contain all tasks
+    remove_checkpoints(checkpoints, all_relations, rule_lengths)
 rules_statistics(rl.rules_dict)
@@ -0,0 +1,55 @@
+import json
+import argparse
+from datetime import datetime
+
+from grapher import Grapher
+from rule import rules_from_dicts
+from rule_learning import Rule_Learner, rules_statistics
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dataset", "-d", default="", type=str)
+parser.add_argument("--shards", "-r", default=[], type=str, nargs="+")
+parsed = vars(parser.parse_args())
+
+dataset = parsed["dataset"]
+dataset_dir = "../data/" + dataset + "/"
+dir_path = "../output/" + dataset + "/"
+data = Grapher(dataset_dir)
+
+shards = dict()
+for filename in parsed["shards"]:
+    with open(dir_path + filename, encoding="utf-8") as fin:
+        shard_rules = json.load(fin)
+    if shard_rules["shard"] in shards:
+        parser.error("shard {0} is given twice".format(shard_rules["shard"]))
+    shards[shard_rules["shard"]] = shard_rules
+
+num_shards = shards[min(shards)]["num_shards"] if shards else 0
+params = shards[min(shards)]["params"] if shards else None
+for shard_rules in shards.values():
+    if shard_rules["num_shards"] != num_shards or shard_rules["params"] != params:
+        parser.error("the shards are from different runs")
+missing = sorted(set(range(num_shards)) - set(shards))
+if not shards or missing:
+    parser.error("missing shards: {0}".format(missing or "all"))
+
+# The same order of the relations and rules as without shards
+all_rules = dict()
+for shard_rules in shards.values():
+    all_rules.update(rules_from_dicts(shard_rules["rules"]))
+rl = Rule_Learner(dict(), data.id2relation, data.inv_relation_id, dataset)
+rl.rules_dict = {rel: all_rules[rel] for rel in sorted(all_rules)}
+rl.sort_rules_dict()
+
+dt = datetime.now()
+dt = dt.strftime("%Y%m%d%H%M%S")
+rule_lengths = params["rule_lengths"]
+num_walks = params["num_walks"]
+transition_distr = params["transition_distr"]
+seed = params["seed"]
+rl.save_rules(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_store(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_verbalized(dt, rule_lengths, num_walks, transition_distr, seed)
+print("Merged {0} shards.".format(num_shards))
+rules_statistics(rl.rules_dict)
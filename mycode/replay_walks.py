@@ -0,0 +1,76 @@
+import os
+import time
+import argparse
+from datetime import datetime
+
+from grapher import Grapher
+from edge_index import Edge_Index
+from temporal_walk import store_edges
+from rule_learning import Rule_Learner, rules_statistics
+from walk_log import Walk_Log
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dataset", "-d", default="", type=str)
+parser.add_argument("--walks", "-w", default="", type=str)  # Name of the walk log
+parser.add_argument("--rule_lengths", "-l", default=None, type=int, nargs="+")  # None: all logged
+parser.add_argument("--num_walks", "-n", default=None, type=int)  # None: all logged walks
+parser.add_argument("--seed", "-s", default=None, type=int)  # None: seed of the learning run
+parser.add_argument("--confidence", default="sample", type=str, choices=["sample", "exact", "adaptive"])
+parser.add_argument("--max_groundings", default=1000000, type=int)
+parser.add_argument("--conf_tolerance", default=0.05, type=float)
+parser.add_argument("--min_conf", default=0.0, type=float)
+parser.add_argument("--body_cache", default=256, type=int)  # MB, 0: no cache
+parsed = vars(parser.parse_args())
+
+dataset = parsed["dataset"]
+dataset_dir = "../data/" + dataset + "/"
+data = Grapher(dataset_dir)
+walk_log = Walk_Log("../output/" + dataset + "/" + parsed["walks"] + "/")
+meta = walk_log.load_meta()
+if os.path.basename(data.cache_file("train.txt")) != meta["train"]:
+    parser.error("the walks have been sampled on other training data")
+rule_lengths = parsed["rule_lengths"] or meta["rule_lengths"]
+num_walks = parsed["num_walks"] or meta["num_walks"]
+transition_distr = meta["transition_distr"]
+seed = meta["seed"] if parsed["seed"] is None else parsed["seed"]
+min_ts = meta["min_ts"]
+
+# The rules are created from the logged walks, only the edges are needed for the confidence
+if min_ts:  # Sorted by time within each relation, as in learn.py with a window
+    edges = Edge_Index(data.train_idx, key_col=1, sort_col=3)
+else:
+    edges = store_edges(data.train_idx)
+rl = Rule_Learner(
+    edges,
+    data.id2relation,
+    data.inv_relation_id,
+    dataset,
+    parsed["confidence"],
+    parsed["max_groundings"],
+    parsed["conf_tolerance"],
+    parsed["min_conf"],
+    parsed["body_cache"] * 2 ** 20,
+    seed,
+    min_ts,
+)
+
+start = time.time()
+num_replayed = 0
+# Same order of the relations and rules as in learn.py
+for rel, length in walk_log.tasks():
+    if length in rule_lengths:
+        walks = walk_log.read(rel, length, parsed["num_walks"])
+        for walk in walks:
+            rl.create_rule(walk)
+        num_replayed += len(walks)
+end = time.time()
+print("Replayed {0} walks in {1:.2f} s".format(num_replayed, end - start))
+
+rl.sort_rules_dict()
+dt = datetime.now()
+dt = dt.strftime("%Y%m%d%H%M%S")
+rl.save_rules(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_store(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_verbalized(dt, rule_lengths, num_walks, transition_distr, seed)
+rules_statistics(rl.rules_dict)
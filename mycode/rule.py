@@ -0,0 +1,163 @@
+class Rule(object):
+    __slots__ = [
+        "head_rel",
+        "body_rels",
+        "var_constraints",
+        "body_timestamp_order",
+        "conf",
+        "rule_supp",
+        "body_supp",
+        "num_samples",
+    ]
+
+    def __init__(
+        self,
+        head_rel,
+        body_rels,
+        var_constraints,
+        body_timestamp_order,
+        conf=0,
+        rule_supp=0,
+        body_supp=0,
+        num_samples=None,
+    ):
+        """
+        Compact rule with fixed attributes (less than half of the memory of a dict
+        with lists). The body is stored as tuples, which can be shared by all rules
+        with the same body (see intern_body).
+
+        Parameters:
+            head_rel (int): head relation
+            body_rels (tuple): body relations
+            var_constraints (tuple): indices of reoccurring entities (tuple of tuples)
+            body_timestamp_order (tuple): rank of the timestamp of each body relation
+            conf (float): confidence
+            rule_supp (int): rule support
+            body_supp (int): body support
+            num_samples (int): number of sampled bodies (None if unknown)
+
+        Returns:
+            None
+        """
+
+        self.head_rel = head_rel
+        self.body_rels = body_rels
+        self.var_constraints = var_constraints
+        self.body_timestamp_order = body_timestamp_order
+        self.conf = conf
+        self.rule_supp = rule_supp
+        self.body_supp = body_supp
+        self.num_samples = num_samples
+
+    def __reduce__(self):
+        # Pickle the values without the attribute names (e.g., results of worker processes)
+        return Rule, tuple(getattr(self, name) for name in Rule.__slots__)
+
+    def __repr__(self):
+        return "Rule({0})".format(self.to_dict())
+
+    def to_dict(self):
+        """
+        Convert the rule to a dict (the format of the rules files).
+
+        Parameters:
+            None
+
+        Returns:
+            rule (dict): rule
+        """
+
+        rule = {
+            "head_rel": self.head_rel,
+            "body_rels": list(self.body_rels),
+            "var_constraints": [list(x) for x in self.var_constraints],
+            "body_timestamp_order": list(self.body_timestamp_order),
+            "conf": self.conf,
+            "rule_supp": self.rule_supp,
+            "body_supp": self.body_supp,
+        }
+        if self.num_samples is not None:
+            rule["num_samples"] = self.num_samples
+
+        return rule
+
+
+def intern_body(body, bodies):
+    """
+    Get the shared instance of a rule body.
+
+    Parameters:
+        body (tuple): (body_rels, var_constraints, body_timestamp_order) as tuples of ints
+        bodies (dict): shared bodies (updated in place)
+
+    Returns:
+        body (tuple): shared body
+    """
+
+    return bodies.setdefault(body, body)
+
+
+def rule_from_dict(rule, bodies=None):
+    """
+    Convert a rule from a rules file to a Rule.
+
+    Parameters:
+        rule (dict): rule
+        bodies (dict): shared bodies, see intern_body (None - no sharing)
+
+    Returns:
+        rule (Rule): compact rule
+    """
+
+    body = (
+        tuple(int(x) for x in rule["body_rels"]),
+        tuple(tuple(int(x) for x in const) for const in rule["var_constraints"]),
+        tuple(int(x) for x in rule["body_timestamp_order"]),
+    )
+    if bodies is not None:
+        body = intern_body(body, bodies)
+    rule = Rule(
+        int(rule["head_rel"]),
+        *body,
+        rule["conf"],
+        rule["rule_supp"],
+        rule["body_supp"],
+        rule.get("num_samples"),
+    )
+
+    return rule
+
+
+def rules_from_dicts(rules_dict):
+    """
+    Convert the rules from a rules file to Rules with shared bodies.
+
+    Parameters:
+        rules_dict (dict): rules for each head relation (keys can be strings)
+
+    Returns:
+        rules_dict (dict): Rules for each head relation
+    """
+
+    bodies = dict()
+    rules_dict = {
+        int(k): [rule_from_dict(rule, bodies) for rule in v] for k, v in rules_dict.items()
+    }
+
+    return rules_dict
+
+
+def rules_to_dicts(rules_dict):
+    """
+    Convert Rules to the format of the rules files.
+
+    Parameters:
+        rules_dict (dict): Rules for each head relation
+
+    Returns:
+        rules_dict (dict): rules (dicts) for each head relation
+    """
+
+    rules_dict = {int(k): [rule.to_dict() for rule in v] for k, v in rules_dict.items()}
+
+    return rules_dict
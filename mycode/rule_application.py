@@ -26,9 +26,9 @@ def filter_rules(rules_dict, min_conf, min_body_supp, rule_lengths):
         new_rules_dict[k] = []
         for rule in rules_dict[k]:
             cond = (
-                (rule["conf"] >= min_conf)
-                and (rule["body_supp"] >= min_body_supp)
-                and (len(rule["body_rels"]) in rule_lengths)
+                (rule.conf >= min_conf)
+                and (rule.body_supp >= min_body_supp)
+                and (len(rule.body_rels) in rule_lengths)
             )
             if cond:
                 new_rules_dict[k].append(rule)
@@ -77,7 +77,7 @@ def match_body_relations(rule, edges, test_query_sub):
     Memory-efficient implementation.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         edges (dict): edges for rule application
         test_query_sub (int): test query subject
 
@@ -85,7 +85,7 @@ def match_body_relations(rule, edges, test_query_sub):
         walk_edges (list of np.ndarrays): edges that could constitute rule walks
     """
 
-    rels = rule["body_rels"]
+    rels = rule.body_rels
     # Match query subject and first body relation
     try:
         rel_edges = edges[rels[0]]
@@ -123,7 +123,7 @@ def match_body_relations_complete(rule, edges, test_query_sub):
     current targets and the relation the next relation in the rule body.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         edges (dict): edges for rule application
         test_query_sub (int): test query subject
 
@@ -131,7 +131,7 @@ def match_body_relations_complete(rule, edges, test_query_sub):
         walk_edges (list of np.ndarrays): edges that could constitute rule walks
     """
 
-    rels = rule["body_rels"]
+    rels = rule.body_rels
     # Match query subject and first body relation
     try:
         rel_edges = edges[rels[0]]
@@ -157,26 +157,27 @@ def match_body_relations_complete(rule, edges, test_query_sub):
     return walk_edges
 
 
-def get_walks(rule, walk_edges):
+def get_walks(rule, walk_edges, plan):
     """
     Get walks for a given rule. Take the time constraints into account.
     Memory-efficient implementation.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         walk_edges (list of np.ndarrays): edges from match_body_relations
+        plan (Rule_Plan): compiled body of the rule
 
     Returns:
         rule_walks (pd.DataFrame): all walks matching the rule
     """
-    body_timestamp_order = rule["body_timestamp_order"]
+
     df_edges = []
     df = pd.DataFrame(
         walk_edges[0],
         columns=["entity_" + str(0), "entity_" + str(1), "timestamp_" + str(0)],
         dtype=np.uint16,
     )  # Change type if necessary for better memory efficiency
-    if not rule["var_constraints"]:
+    if not rule.var_constraints:
         del df["entity_" + str(0)]
     df_edges.append(df)
     df = df[0:0]  # Memory efficiency
@@ -191,62 +192,12 @@ def get_walks(rule, walk_edges):
         df = df[0:0]
 
     rule_walks = df_edges[0]
-
-    if len(df_edges) == 2:
-        rule_walks = pd.merge(rule_walks, df_edges[1], on=["entity_" + str(1)])
-    elif len(df_edges) == 3:
-        rule_walks = pd.merge(rule_walks, df_edges[1], on=["entity_" + str(1)])
-        rule_walks = pd.merge(rule_walks, df_edges[2], on=["entity_" + str(2)])
-
     for i in range(1, len(df_edges)):
-
-        if body_timestamp_order == [0, 1]:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] <= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [1, 0]:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] >= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [0, 1, 2]:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] <= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [2, 1, 0]:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] >= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [0, 2, 1] and i == 1:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] <= rule_walks["timestamp_" + str(i+1)]
-            ]
-        elif body_timestamp_order == [0, 2, 1] and i == 2:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] >= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [1, 0, 2] and i == 1:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] >= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [1, 0, 2] and i == 2:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 2)] <= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [1, 2, 0] and i == 1:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] <= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [1, 2, 0] and i == 2:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 2)] >= rule_walks["timestamp_" + str(i)]
-            ]
-        elif body_timestamp_order == [2, 0, 1] and i == 1:
-            rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] >= rule_walks["timestamp_" + str(i+1)]
-            ]
-        elif body_timestamp_order == [2, 0, 1] and i == 2:
+        rule_walks = pd.merge(rule_walks, df_edges[i], on=["entity_" + str(i)])
+        # Filter as soon as possible so that longer rules do not create too many walks
+        for first, second in plan.time_checks[i]:
             rule_walks = rule_walks[
-                rule_walks["timestamp_" + str(i - 1)] <= rule_walks["timestamp_" + str(i)]
+                rule_walks["timestamp_" + str(first)] <= rule_walks["timestamp_" + str(second)]
             ]
 
     return rule_walks
@@ -257,7 +208,7 @@ def get_walks_complete(rule, walk_edges):
     Get complete walks for a given rule. Take the time constraints into account.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         walk_edges (list of np.ndarrays): edges from match_body_relations
 
     Returns:
@@ -330,7 +281,7 @@ def get_candidates(
     Add the confidence of the rule that leads to these candidates.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         rule_walks (pd.DataFrame): rule walks (satisfying all constraints from the rule)
         test_query_ts (int): test query timestamp
         cands_dict (dict): candidates along with the confidences of the rules that generated these candidates
@@ -342,7 +293,7 @@ def get_candidates(
         cands_dict (dict): updated candidates
     """
 
-    max_entity = "entity_" + str(len(rule["body_rels"]))
+    max_entity = "entity_" + str(len(rule.body_rels))
     cands = set(rule_walks[max_entity])
 
     for cand in cands:
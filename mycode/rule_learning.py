@@ -1,21 +1,54 @@
 from datetime import datetime
 import os
 import json
-import itertools
+import hashlib
 import numpy as np
-from collections import Counter
+from collections import Counter, OrderedDict
+
+from edge_index import Edge_Index
+from rule_plan import Rule_Plan
+from rule_store import save_rule_store
+from rule import Rule, intern_body, rules_to_dicts
 
 
 class Rule_Learner(object):
-    def __init__(self, edges, id2relation, inv_relation_id, dataset):
+    def __init__(
+        self,
+        edges,
+        id2relation,
+        inv_relation_id,
+        dataset,
+        confidence_mode="sample",
+        max_groundings=1000000,
+        conf_tolerance=0.05,
+        min_conf=0.0,
+        body_cache_size=0,
+        seed=None,
+        min_ts=0,
+    ):
         """
         Initialize rule learner object.
 
         Parameters:
-            edges (dict): edges for each relation
+            edges (Edge_Index): edges for each relation
             id2relation (dict): mapping of index to relation
             inv_relation_id (dict): mapping of relation to inverse relation
             dataset (str): dataset name
+            confidence_mode (str): "sample" - estimate the confidence from sampled bodies
+                                   "exact" - count all body groundings
+                                   "adaptive" - sample bodies in rounds until the confidence
+                                                is known precisely enough
+            max_groundings (int): maximum number of partial body groundings in exact mode,
+                                  the confidence of rules with more groundings is sampled
+            conf_tolerance (float): adaptive mode, stop sampling once the 95% confidence
+                                    interval of the confidence is at most 2 * conf_tolerance wide
+            min_conf (float): adaptive mode, stop sampling once the confidence is
+                              clearly (95% interval) below min_conf
+            body_cache_size (int): maximum number of bytes of the sampled or counted
+                                   bodies that are kept for other head relations (0 - no cache)
+            seed (int): random seed for sampling bodies (None - not reproducible)
+            min_ts (int): only use the bodies from this timestamp on (learning window),
+                          requires an Edge_Index sorted by time as edges (0 - all bodies)
 
         Returns:
             None
@@ -24,8 +57,24 @@ class Rule_Learner(object):
         self.edges = edges
         self.id2relation = id2relation
         self.inv_relation_id = inv_relation_id
-
-        self.found_rules = []
+        self.confidence_mode = confidence_mode
+        self.max_groundings = max_groundings
+        self.conf_tolerance = conf_tolerance
+        self.min_conf = min_conf
+        self.min_ts = min_ts
+        self.subject_index = None  # Edges by (relation, subject), sorted by time
+        self.pair_index = None  # Edges by (relation, subject, object), sorted by time
+        self.plans = dict()  # Compiled rule bodies by body_key
+        self.bodies = dict()  # Shared body tuples of the rules, see rule.intern_body
+        # Unique bodies and number of samples for each body (least recently used first)
+        self.body_cache_size = body_cache_size
+        self.body_cache = OrderedDict()
+        self.body_cache_bytes = 0
+        self.body_cache_lookups = 0
+        self.body_cache_hits = 0
+        self.seed = seed
+
+        self.found_rules = set()  # Keys of the rules found so far, see rule_key
         self.rules_dict = dict()
         self.output_dir = "../output/" + dataset + "/"
         if not os.path.exists(self.output_dir):
@@ -40,16 +89,16 @@ class Rule_Learner(object):
                          {"entities": list, "relations": list, "timestamps": list}
 
         Returns:
-            rule (dict): created rule
+            None
         """
 
-        rule = dict()
-        rule["head_rel"] = int(walk["relations"][0])
-        rule["body_rels"] = [
-            self.inv_relation_id[x] for x in walk["relations"][1:][::-1]
-        ]
-        rule["var_constraints"] = self.define_var_constraints(
-            walk["entities"][1:][::-1]
+        head_rel = int(walk["relations"][0])
+        body_rels = tuple(
+            int(self.inv_relation_id[x]) for x in walk["relations"][1:][::-1]
+        )
+        var_constraints = tuple(
+            tuple(int(x) for x in const)
+            for const in self.define_var_constraints(walk["entities"][1:][::-1])
         )
 
         walk["timestamps"][1:] = walk["timestamps"][-1:0:-1]
@@ -83,18 +132,20 @@ class Rule_Learner(object):
                     ordered_indexes.append(body_timestamps_order_dict[body_timestamps[i]] + processed_timestamps_num_counts[body_timestamps[i]])
                     processed_timestamps_num_counts[body_timestamps[i]] += 1
 
-        rule["body_timestamp_order"] = ordered_indexes
-
+        body = intern_body((body_rels, var_constraints, tuple(ordered_indexes)), self.bodies)
+        rule = Rule(head_rel, *body)
 
-        if rule not in self.found_rules:
-            self.found_rules.append(rule.copy())
+        key = rule_key(rule)
+        if key not in self.found_rules:
+            self.found_rules.add(key)
             (
-                rule["conf"],
-                rule["rule_supp"],
-                rule["body_supp"],
-            ) = self.estimate_confidence(rule)
+                rule.conf,
+                rule.rule_supp,
+                rule.body_supp,
+                rule.num_samples,
+            ) = self.calculate_confidence(rule)
 
-            if rule["conf"]:
+            if rule.conf:
                 self.update_rules_dict(rule)
 
     def define_var_constraints(self, entities):
@@ -116,170 +167,464 @@ class Rule_Learner(object):
 
         return sorted(var_constraints)
 
-    def estimate_confidence(self, rule, num_samples=500):
+    def calculate_confidence(self, rule):
         """
-        Estimate the confidence of the rule by sampling bodies and checking the rule support.
+        Calculate the confidence of the rule with the configured confidence mode.
+        In exact mode, fall back to sampling if the rule has too many body groundings.
 
         Parameters:
-            rule (dict): rule
+            rule (Rule): rule
 
-            num_samples (int): number of samples
+        Returns:
+            confidence (float): confidence of the rule, rule_support/body_support
+            rule_support (int): rule support
+            body_support (int): body support
+            num_samples (int): number of sampled bodies (0 if all bodies are counted)
+        """
+
+        if self.confidence_mode == "exact":
+            result = self.count_confidence(rule)
+            if result is not None:
+                return result
+        elif self.confidence_mode == "adaptive":
+            return self.estimate_confidence_adaptive(rule)
+
+        return self.estimate_confidence(rule)
+
+    def count_confidence(self, rule):
+        """
+        Calculate the exact confidence of the rule from all groundings of the body.
+
+        Parameters:
+            rule (Rule): rule
 
         Returns:
             confidence (float): confidence of the rule, rule_support/body_support
             rule_support (int): rule support
             body_support (int): body support
+            num_samples (int): 0, no bodies are sampled
+            (None if there are more than self.max_groundings partial groundings)
         """
 
-        all_bodies = []
-        for _ in range(num_samples):
+        key = ("exact", body_key(rule))
+        entry = self.get_cached_bodies(key)
+        if entry is None:
+            bodies = self.ground_body(self.get_plan(rule))
+            if bodies is not None:
+                bodies = np.unique(bodies, axis=0)
+            entry = (bodies,)
+            self.cache_bodies(key, entry)
+        bodies = entry[0]
+        if bodies is None:
+            return None
+
+        body_support = len(bodies)
+        confidence, rule_support = 0, 0
+        if body_support:
+            rule_support = self.calculate_rule_support(bodies, rule.head_rel)
+            confidence = round(rule_support / body_support, 6)
+
+        return confidence, rule_support, body_support, 0
+
+    def ground_body(self, plan):
+        """
+        Find all groundings of the rule body with vectorized joins along the body relations.
+        The groundings fulfill the same conditions as the bodies from self.sample_bodies.
+
+        Parameters:
+            plan (Rule_Plan): compiled rule body
+
+        Returns:
+            bodies (np.ndarray): entities and timestamps (alternately entity and timestamp)
+                                 of the groundings, one grounding per row
+                                 (None if there are more than self.max_groundings partial groundings)
+        """
 
-            sample_successful, body_ents_tss = self.sample_body(
-                rule["body_rels"], rule["var_constraints"], rule["body_timestamp_order"]
+        first_edges = self.window_edges(plan.body_rels[0])
+        if len(first_edges) > self.max_groundings:
+            return None
+        ents = [first_edges[:, 0], first_edges[:, 2]]
+        tss = [first_edges[:, 3]]
+        if plan.var_constraints:
+            keep = plan.entity_mask(ents)
+            ents = [x[keep] for x in ents]
+            tss = [x[keep] for x in tss]
+
+        for step in range(1, len(plan.body_rels)):
+            index = self.get_subject_index()
+            lo, hi = timestamp_ranges(
+                index, plan.body_rels[step], ents[-1], tss, plan, self.min_ts
             )
-            if sample_successful:
-                all_bodies.append(body_ents_tss)
+            counts = np.maximum(hi - lo, 0)
+            total = int(np.sum(counts))
+            if total > self.max_groundings:
+                return None
+
+            # Expand each partial grounding with all matching edges
+            grounding_idx = np.repeat(np.arange(len(counts)), counts)
+            first_match = np.cumsum(counts) - counts
+            edge_pos = lo[grounding_idx] + np.arange(total) - first_match[grounding_idx]
+            next_edges = index.quads[edge_pos]
+            ents = [x[grounding_idx] for x in ents] + [next_edges[:, 2]]
+            tss = [x[grounding_idx] for x in tss] + [next_edges[:, 3]]
+            if plan.var_constraints:
+                keep = plan.entity_mask(ents)
+                ents = [x[keep] for x in ents]
+                tss = [x[keep] for x in tss]
+
+        return combine_bodies(ents, tss)
+
+    def get_plan(self, rule):
+        """
+        Get the compiled body of the rule (compiled on first use).
+
+        Parameters:
+            rule (Rule): rule
+
+        Returns:
+            plan (Rule_Plan): compiled rule body
+        """
+
+        key = body_key(rule)
+        if key not in self.plans:
+            self.plans[key] = Rule_Plan(rule)
+
+        return self.plans[key]
+
+    def window_edges(self, rel):
+        """
+        Get the edges of the relation in the learning window (a slice of the time-sorted
+        edges, no copy).
+
+        Parameters:
+            rel (int): relation
+
+        Returns:
+            edges (np.ndarray): edges from self.min_ts on
+        """
 
-        all_bodies.sort()
-        unique_bodies = list(x for x, _ in itertools.groupby(all_bodies))
+        if not self.min_ts:
+            return self.edges[rel]
+        end = self.edges.segment(rel)[1]
+        start = self.edges.search(rel, self.min_ts)[1]
+
+        return self.edges.quads[start:end]
+
+    def build_indexes(self):
+        """
+        Index the edges of all relations by (relation, subject) and by (relation, subject,
+        object), sorted by time within each key. Each index is one set of arrays for all
+        relations, so it can be shared by all processes (see Shared_Arrays).
+        The edges are taken in the order of self.edges, so the edges with the same key and
+        timestamp are in the same order as in the edges of their relation.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        self.subject_index = Edge_Index(self.edges.quads, key_col=(1, 0), sort_col=3)
+        self.pair_index = Edge_Index(self.edges.quads, key_col=(1, 0, 2), sort_col=3)
+
+    def get_subject_index(self):
+        """
+        Get the edges indexed by (relation, subject) and sorted by time (built on first use).
+
+        Parameters:
+            None
+
+        Returns:
+            index (Edge_Index): edge index
+        """
+
+        if self.subject_index is None:
+            self.build_indexes()
+
+        return self.subject_index
+
+    def get_pair_index(self):
+        """
+        Get the edges indexed by (relation, subject, object) and sorted by time
+        (built on first use).
+
+        Parameters:
+            None
+
+        Returns:
+            index (Edge_Index): edge index
+        """
+
+        if self.pair_index is None:
+            self.build_indexes()
+
+        return self.pair_index
+
+    def estimate_confidence(self, rule, num_samples=500):
+        """
+        Estimate the confidence of the rule by sampling bodies and checking the rule support.
+
+        Parameters:
+            rule (Rule): rule
+            num_samples (int): number of samples
+
+        Returns:
+            confidence (float): confidence of the rule, rule_support/body_support
+            rule_support (int): rule support
+            body_support (int): body support
+            num_samples (int): number of samples
+        """
+
+        key = ("sample", num_samples, body_key(rule))
+        entry = self.get_cached_bodies(key)
+        if entry is None:
+            all_bodies = self.sample_bodies(self.get_plan(rule), num_samples, self.body_rng(key))
+            entry = (np.unique(all_bodies, axis=0),)
+            self.cache_bodies(key, entry)
+        unique_bodies = entry[0]
         body_support = len(unique_bodies)
 
         confidence, rule_support = 0, 0
         if body_support:
-            rule_support = self.calculate_rule_support(unique_bodies, rule["head_rel"])
+            rule_support = self.calculate_rule_support(unique_bodies, rule.head_rel)
             confidence = round(rule_support / body_support, 6)
 
-        return confidence, rule_support, body_support
+        return confidence, rule_support, body_support, num_samples
 
-    def sample_body(self, body_rels, var_constraints, body_timestamp_order):
+    def estimate_confidence_adaptive(self, rule, max_samples=500, round_samples=50):
         """
-        Sample a walk according to the rule body and body_timestamp_order.
+        Estimate the confidence of the rule by sampling bodies in rounds (of growing size).
+        Stop if the Wilson interval of the confidence is at most 2 * self.conf_tolerance
+        wide (once a body supports the rule), if it is below self.min_conf, or if a round
+        only found known bodies. The rounds sampled for other head relations are reused,
+        which gives the same result as sampling them again with self.body_rng.
 
         Parameters:
-            body_rels (list): relations in the rule body
-            var_constraints (list): variable constraints for the entities
-            body_timestamp_order (list): the order of the timestamps in the body
+            rule (Rule): rule
+            max_samples (int): maximum number of samples
+            round_samples (int): number of samples in the first round
 
         Returns:
-            sample_successful (bool): if a body has been successfully sampled
-            body_ents_tss (list): entities and timestamps (alternately entity and timestamp)
-                                  of the sampled body
-        """
-
-        sample_successful = True
-        body_ents_tss = []
-        cur_rel = body_rels[0]
-        rel_edges = self.edges[cur_rel]
-        next_edge = rel_edges[np.random.choice(len(rel_edges))]
-        cur_ts = next_edge[3]
-        ts_1 = next_edge[3]
-        cur_node = next_edge[2]
-        body_ents_tss.append(next_edge[0])
-        body_ents_tss.append(cur_ts)
-        body_ents_tss.append(cur_node)
-        iteration = 0
+            confidence (float): confidence of the rule, rule_support/body_support
+            rule_support (int): rule support
+            body_support (int): body support
+            num_samples (int): number of samples
+        """
 
-        for cur_rel in body_rels[1:]:
-            next_edges = self.edges[cur_rel]
-            if len(body_timestamp_order) == 2:
-                if body_timestamp_order[0] < body_timestamp_order[1]:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= ts_1)
-                else:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= ts_1)
-            elif len(body_timestamp_order) == 3:
-                if body_timestamp_order == [0, 1, 2]:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= cur_ts)
-                    iteration += 1
-                elif body_timestamp_order == [2, 1, 0]:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= cur_ts)
-                    iteration += 1
-                elif body_timestamp_order == [0, 2, 1] and iteration == 0: 
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [0, 2, 1] and iteration == 1:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= ts_2) * (next_edges[:, 3] >= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [1, 0, 2] and iteration == 0:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [1, 0, 2] and iteration == 1:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [1, 2, 0] and iteration == 0:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [1, 2, 0] and iteration == 1:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [2, 0, 1] and iteration == 0:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] <= ts_1)
-                    iteration += 1
-                elif body_timestamp_order == [2, 0, 1] and iteration == 1:
-                    mask = (next_edges[:, 0] == cur_node) * (next_edges[:, 3] >= ts_2) * (next_edges[:, 3] <= ts_1)
-                    iteration += 1
-            filtered_edges = next_edges[mask]
-
-            if len(filtered_edges):
-                next_edge = filtered_edges[np.random.choice(len(filtered_edges))]
-                cur_ts = next_edge[3]
-                if iteration == 1:
-                    ts_2 = cur_ts
-                cur_node = next_edge[2]
-                body_ents_tss.append(cur_ts)
-                body_ents_tss.append(cur_node)
-            else:
-                sample_successful = False
+        key = ("adaptive", body_key(rule))
+        entry = self.get_cached_bodies(key)
+        if entry is None:
+            num_cols = 2 * len(rule.body_rels) + 1
+            no_bodies = np.empty((0, num_cols), dtype=np.int64)
+            entry = (no_bodies, np.empty(0, dtype=np.int64), [], self.body_rng(key))
+        # Unique bodies, round in which each body was found first, number of successful
+        # samples in each round, random generator for the next round
+        unique_bodies, body_rounds, round_found, rng = entry
+        supported = self.supported_bodies(unique_bodies, rule.head_rel)
+
+        # Replay the cached rounds and continue sampling if they are not enough
+        num_samples, round_idx = 0, 0
+        rule_support, body_support = 0, 0
+        while num_samples < max_samples:
+            if body_support:
+                low, high = wilson_interval(rule_support, body_support)
+                if high < self.min_conf:
+                    break
+                if rule_support and high - low <= 2 * self.conf_tolerance:
+                    break
+            # The rounds grow with the samples so far to limit the overhead per round
+            num = min(max(round_samples, num_samples), max_samples - num_samples)
+            if round_idx == len(round_found):
+                bodies = self.sample_bodies(self.get_plan(rule), num, rng)
+                all_bodies = np.vstack((unique_bodies, bodies))
+                all_rounds = np.append(body_rounds, np.full(len(bodies), round_idx))
+                unique_bodies, idx = np.unique(all_bodies, axis=0, return_index=True)
+                body_rounds = all_rounds[idx]
+                round_found.append(len(bodies))
+                supported = self.supported_bodies(unique_bodies, rule.head_rel)
+            num_samples += num
+            new_bodies = body_rounds == round_idx
+            num_new = int(np.count_nonzero(new_bodies))
+            body_support += num_new
+            rule_support += int(np.count_nonzero(supported[new_bodies]))
+            if not num_new and round_found[round_idx]:
                 break
+            round_idx += 1
+
+        self.cache_bodies(key, (unique_bodies, body_rounds, round_found, rng))
+        confidence = round(rule_support / body_support, 6) if body_support else 0
+
+        return confidence, rule_support, body_support, num_samples
+
+    def get_cached_bodies(self, key):
+        """
+        Get the cached bodies for a body signature.
+
+        Parameters:
+            key (tuple): (confidence mode, body_key of the rule)
 
-        if sample_successful and var_constraints:
-            # Check variable constraints
-            body_var_constraints = self.define_var_constraints(body_ents_tss[::2])
-            if body_var_constraints != var_constraints:
-                sample_successful = False
+        Returns:
+            entry (tuple): cached entry, the unique bodies first, None if not cached
+        """
+
+        if not self.body_cache_size:
+            return None
+
+        self.body_cache_lookups += 1
+        entry = self.body_cache.get(key)
+        if entry is not None:
+            self.body_cache_hits += 1
+            self.body_cache.move_to_end(key)
 
-        return sample_successful, body_ents_tss
+        return entry
+
+    def cache_bodies(self, key, entry):
+        """
+        Cache the bodies for a body signature and remove the least recently used bodies
+        if the cache is larger than self.body_cache_size bytes.
+
+        Parameters:
+            key (tuple): (confidence mode, body_key of the rule)
+            entry (tuple): unique bodies (None if there are too many groundings in exact mode)
+                           and further data of the confidence mode
+
+        Returns:
+            None
+        """
+
+        if not self.body_cache_size:
+            return
+
+        if key in self.body_cache:
+            self.body_cache_bytes -= entry_bytes(self.body_cache.pop(key))
+        num_bytes = entry_bytes(entry)
+        if num_bytes > self.body_cache_size:
+            return
+        self.body_cache[key] = entry
+        self.body_cache_bytes += num_bytes
+        while self.body_cache_bytes > self.body_cache_size:
+            old_entry = self.body_cache.popitem(last=False)[1]
+            self.body_cache_bytes -= entry_bytes(old_entry)
+
+    def body_rng(self, key):
+        """
+        Get a random generator for sampling the bodies of a body signature.
+        With a seed, the sampled bodies only depend on the seed and the body signature,
+        not on the other rules that have been learned before or on the cache.
+
+        Parameters:
+            key (tuple): (confidence mode, ..., body_key of the rule)
+
+        Returns:
+            rng (np.random.Generator): random generator
+        """
+
+        if self.seed is None:
+            return np.random.default_rng()
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+        return np.random.default_rng([self.seed, int(digest[:15], 16)])
+
+    def sample_bodies(self, plan, num_samples, rng):
+        """
+        Sample walks according to the rule body and body_timestamp_order (all at once).
+        Each walk starts with a random edge of the first body relation and continues with
+        a random edge among the edges from the current entity whose timestamp fits the
+        body_timestamp_order (equal timestamps are allowed).
+        If there are variable constraints, the entities of the walk have to fulfill
+        exactly these constraints.
+
+        Parameters:
+            plan (Rule_Plan): compiled rule body
+            num_samples (int): number of samples
+            rng (np.random.Generator): random generator
+
+        Returns:
+            bodies (np.ndarray): entities and timestamps (alternately entity and timestamp)
+                                 of the successfully sampled bodies, one body per row
+        """
+
+        rel_edges = self.window_edges(plan.body_rels[0])
+        first_edges = rel_edges[rng.integers(len(rel_edges), size=num_samples)]
+        ents = [first_edges[:, 0], first_edges[:, 2]]
+        tss = [first_edges[:, 3]]
+        if plan.var_constraints:
+            keep = plan.entity_mask(ents)
+            ents = [x[keep] for x in ents]
+            tss = [x[keep] for x in tss]
+
+        for step in range(1, len(plan.body_rels)):
+            index = self.get_subject_index()
+            lo, hi = timestamp_ranges(
+                index, plan.body_rels[step], ents[-1], tss, plan, self.min_ts
+            )
+            found = hi > lo
+            ents = [x[found] for x in ents]
+            tss = [x[found] for x in tss]
+            lo, hi = lo[found], hi[found]
+            pos = lo + (rng.random(len(lo)) * (hi - lo)).astype(np.int64)
+            next_edges = index.quads[pos]
+            ents.append(next_edges[:, 2])
+            tss.append(next_edges[:, 3])
+            if plan.var_constraints:
+                keep = plan.entity_mask(ents)
+                ents = [x[keep] for x in ents]
+                tss = [x[keep] for x in tss]
+
+        return combine_bodies(ents, tss)
 
     def calculate_rule_support(self, unique_bodies, head_rel):
         """
-        Calculate the rule support.
+        Calculate the rule support, i.e., the number of bodies with an edge of the head
+        relation from the first to the last entity of the body after the last body timestamp.
 
         Parameters:
-            unique_bodies (list): bodies from self.sample_body
+            unique_bodies (np.ndarray): bodies from self.sample_bodies or self.ground_body
             head_rel (int): head relation
 
         Returns:
             rule_support (int): rule support
         """
 
-        rule_support = 0
-        head_rel_edges = self.edges[head_rel]
-        for body in unique_bodies:
-            mask = (
-                (head_rel_edges[:, 0] == body[0])
-                * (head_rel_edges[:, 2] == body[-1])
-                * (head_rel_edges[:, 3] > body[-2])
-            )
-
-            if True in mask:
-                rule_support += 1
+        rule_support = int(np.count_nonzero(self.supported_bodies(unique_bodies, head_rel)))
 
         return rule_support
 
+    def supported_bodies(self, bodies, head_rel):
+        """
+        Check for each body if there is an edge of the head relation from the first to the
+        last entity of the body after the last body timestamp.
+
+        Parameters:
+            bodies (np.ndarray): bodies from self.sample_bodies or self.ground_body
+            head_rel (int): head relation
+
+        Returns:
+            supported (np.ndarray): if the body supports the rule
+        """
+
+        index = self.get_pair_index()
+        keys = index.multi_key(head_rel, bodies[:, 0], bodies[:, -1])
+        supported = index.count_greater(keys, bodies[:, -2]) > 0
+
+        return supported
+
     def update_rules_dict(self, rule):
         """
         Update the rules if a new rule has been found.
 
         Parameters:
-            rule (dict): generated rule from self.create_rule
+            rule (Rule): generated rule from self.create_rule
 
         Returns:
             None
         """
 
         try:
-            self.rules_dict[rule["head_rel"]].append(rule)
+            self.rules_dict[rule.head_rel].append(rule)
         except KeyError:
-            self.rules_dict[rule["head_rel"]] = [rule]
+            self.rules_dict[rule.head_rel] = [rule]
 
     def sort_rules_dict(self):
         """
@@ -294,7 +639,7 @@ class Rule_Learner(object):
 
         for rel in self.rules_dict:
             self.rules_dict[rel] = sorted(
-                self.rules_dict[rel], key=lambda x: x["conf"], reverse=True
+                self.rules_dict[rel], key=lambda x: x.conf, reverse=True
             )
 
     def save_rules(self, dt, rule_lengths, num_walks, transition_distr, seed):
@@ -312,7 +657,7 @@ class Rule_Learner(object):
             None
         """
 
-        rules_dict = {int(k): v for k, v in self.rules_dict.items()}
+        rules_dict = rules_to_dicts(self.rules_dict)
         filename = "{0}_r{1}_n{2}_{3}_s{4}_rules.json".format(
             dt, rule_lengths, num_walks, transition_distr, seed
         )
@@ -320,6 +665,75 @@ class Rule_Learner(object):
         with open(self.output_dir + filename, "w", encoding="utf-8") as fout:
             json.dump(rules_dict, fout)
 
+    def save_rules_store(self, dt, rule_lengths, num_walks, transition_distr, seed):
+        """
+        Save all rules in the columnar format of rule_store.Rule_Store.
+
+        Parameters:
+            dt (str): time now
+            rule_lengths (list): rule lengths
+            num_walks (int): number of walks
+            transition_distr (str): transition distribution
+            seed (int): random seed
+
+        Returns:
+            None
+        """
+
+        dirname = "{0}_r{1}_n{2}_{3}_s{4}_rules_store".format(
+            dt, rule_lengths, num_walks, transition_distr, seed
+        )
+        dirname = dirname.replace(" ", "")
+        meta = {
+            "rule_lengths": rule_lengths,
+            "num_walks": num_walks,
+            "transition_distr": transition_distr,
+            "seed": seed,
+        }
+        save_rule_store(self.rules_dict, self.output_dir + dirname, meta)
+
+    def save_rules_shard(
+        self, dt, rule_lengths, num_walks, transition_distr, seed, shard, num_shards, relations
+    ):
+        """
+        Save the rules of one shard of the relations, together with the information
+        that is needed to merge the shards (see merge_rules.py).
+
+        Parameters:
+            dt (str): time now
+            rule_lengths (list): rule lengths
+            num_walks (int): number of walks
+            transition_distr (str): transition distribution
+            seed (int): random seed
+            shard (int): shard number
+            num_shards (int): number of shards
+            relations (list): relations of the shard
+
+        Returns:
+            filename (str): name of the file in self.output_dir
+        """
+
+        shard_rules = {
+            "shard": shard,
+            "num_shards": num_shards,
+            "params": {
+                "rule_lengths": rule_lengths,
+                "num_walks": num_walks,
+                "transition_distr": transition_distr,
+                "seed": seed,
+            },
+            "relations": [int(rel) for rel in relations],
+            "rules": rules_to_dicts(self.rules_dict),
+        }
+        filename = "{0}_r{1}_n{2}_{3}_s{4}_shard{5}of{6}_rules.json".format(
+            dt, rule_lengths, num_walks, transition_distr, seed, shard, num_shards
+        )
+        filename = filename.replace(" ", "")
+        with open(self.output_dir + filename, "w", encoding="utf-8") as fout:
+            json.dump(shard_rules, fout)
+
+        return filename
+
     def save_rules_verbalized(
         self, dt, rule_lengths, num_walks, transition_distr, seed
     ):
@@ -350,44 +764,159 @@ class Rule_Learner(object):
             fout.write(rules_str)
 
 
+def rule_key(rule):
+    """
+    Get a hashable key that identifies the rule (without confidence and supports).
+
+    Parameters:
+        rule (Rule): rule from Rule_Learner.create_rule
+
+    Returns:
+        key (tuple): (head_rel, body_rels, var_constraints, body_timestamp_order)
+    """
+
+    key = (rule.head_rel,) + body_key(rule)
+
+    return key
+
+
+def body_key(rule):
+    """
+    Get a hashable key that identifies the body of the rule.
+    Rules with the same body key have the same body groundings.
+
+    Parameters:
+        rule (Rule): rule from Rule_Learner.create_rule
+
+    Returns:
+        key (tuple): (body_rels, var_constraints, body_timestamp_order)
+    """
+
+    key = (rule.body_rels, rule.var_constraints, rule.body_timestamp_order)
+
+    return key
+
+
+def entry_bytes(entry):
+    """
+    Get the memory used by the arrays of a body cache entry.
+
+    Parameters:
+        entry (tuple): cache entry from Rule_Learner.cache_bodies
+
+    Returns:
+        num_bytes (int): number of bytes
+    """
+
+    return sum(x.nbytes for x in entry if isinstance(x, np.ndarray))
+
+
+def timestamp_ranges(index, rel, nodes, tss, plan, min_ts=0):
+    """
+    Find the edges for the next step of partial bodies, i.e., the edges of the next body
+    relation from the current nodes whose timestamps fit the timestamp order of the body.
+
+    Parameters:
+        index (Edge_Index): edges by (relation, subject), sorted by time
+        rel (int): next body relation
+        nodes (np.ndarray): current nodes of the partial bodies
+        tss (list): timestamp arrays of the partial bodies, one array per previous step
+        plan (Rule_Plan): compiled rule body
+        min_ts (int): first timestamp of the learning window
+
+    Returns:
+        lo (np.ndarray): start of the fitting edges in index.quads
+        hi (np.ndarray): end of the fitting edges in index.quads (exclusive, can be < lo)
+    """
+
+    lower, upper = plan.timestamp_bounds(tss, index.sort_base)
+    if min_ts:
+        lower = np.maximum(lower, min_ts)
+    lo, hi = index.search_range_batch(index.multi_key(rel, nodes), lower, upper)
+
+    return lo, hi
+
+
+def combine_bodies(ents, tss):
+    """
+    Combine the entities and timestamps of bodies to one array.
+
+    Parameters:
+        ents (list): entity arrays of the bodies, one array per position
+        tss (list): timestamp arrays of the bodies, one array per body relation
+
+    Returns:
+        bodies (np.ndarray): entities and timestamps (alternately entity and timestamp),
+                             one body per row
+    """
+
+    columns = [ents[0]]
+    for ts, ent in zip(tss, ents[1:]):
+        columns += [ts, ent]
+
+    return np.column_stack(columns)
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """
+    Calculate the Wilson score interval of a success rate.
+
+    Parameters:
+        successes (int): number of successes
+        trials (int): number of trials (> 0)
+        z (float): quantile of the standard normal distribution (1.96 - 95% interval)
+
+    Returns:
+        low (float): lower bound of the interval
+        high (float): upper bound of the interval
+    """
+
+    rate = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (rate + z ** 2 / (2 * trials)) / denominator
+    half_width = z * np.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+
+    return center - half_width, center + half_width
+
+
 def verbalize_rule(rule, id2relation):
     """
     Verbalize the rule to be in a human-readable format.
 
     Parameters:
-        rule (dict): rule from Rule_Learner.create_rule
+        rule (Rule): rule from Rule_Learner.create_rule
         id2relation (dict): mapping of index to relation
 
     Returns:
         rule_str (str): human-readable rule
     """
 
-    if rule["var_constraints"]:
-        var_constraints = rule["var_constraints"]
+    if rule.var_constraints:
+        var_constraints = [list(x) for x in rule.var_constraints]
         constraints = [x for sublist in var_constraints for x in sublist]
-        for i in range(len(rule["body_rels"]) + 1):
+        for i in range(len(rule.body_rels) + 1):
             if i not in constraints:
                 var_constraints.append([i])
         var_constraints = sorted(var_constraints)
     else:
-        var_constraints = [[x] for x in range(len(rule["body_rels"]) + 1)]
+        var_constraints = [[x] for x in range(len(rule.body_rels) + 1)]
 
     rule_str = "{0:8.6f}  {1:4}  {2:4}  {3}(X0,X{4},T{5}) <- "
     obj_idx = [
         idx
         for idx in range(len(var_constraints))
-        if len(rule["body_rels"]) in var_constraints[idx]
+        if len(rule.body_rels) in var_constraints[idx]
     ][0]
     rule_str = rule_str.format(
-        rule["conf"],
-        rule["rule_supp"],
-        rule["body_supp"],
-        id2relation[rule["head_rel"]],
+        rule.conf,
+        rule.rule_supp,
+        rule.body_supp,
+        id2relation[rule.head_rel],
         obj_idx,
-        len(rule["body_rels"]),
+        len(rule.body_rels),
     )
 
-    for i in range(len(rule["body_rels"])):
+    for i in range(len(rule.body_rels)):
         sub_idx = [
             idx for idx in range(len(var_constraints)) if i in var_constraints[idx]
         ][0]
@@ -396,7 +925,7 @@ def verbalize_rule(rule, id2relation):
         ][0]
 
         rule_str += "{0}(X{1},X{2},T{3}), ".format(
-            id2relation[rule["body_rels"][i]], sub_idx, obj_idx, rule["body_timestamp_order"][i]
+            id2relation[rule.body_rels[i]], sub_idx, obj_idx, rule.body_timestamp_order[i]
         )
 
     return rule_str[:-2]
@@ -420,6 +949,6 @@ def rules_statistics(rules_dict):
 
     lengths = []
     for rel in rules_dict:
-        lengths += [len(x["body_rels"]) for x in rules_dict[rel]]
+        lengths += [len(x.body_rels) for x in rules_dict[rel]]
     rule_lengths = [(k, v) for k, v in Counter(lengths).items()]
     print("Number of rules by length: ", sorted(rule_lengths))
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class Rule_Plan(object):
+    def __init__(self, rule):
+        """
+        Compile the body of a rule into a plan for finding its groundings edge by edge
+        (in the order of the body relations). For each step, the plan states which previous
+        timestamps bound the timestamp of the next edge and which previous entities have to
+        be equal or different to the next entity. Works for any rule length.
+
+        Parameters:
+            rule (Rule): rule
+
+        Returns:
+            None
+        """
+
+        self.body_rels = list(rule.body_rels)
+        self.var_constraints = rule.var_constraints
+        order = rule.body_timestamp_order
+        num_steps = len(self.body_rels)
+
+        # Previous steps with the next lower/higher rank in the timestamp order (-1 if none)
+        # Bounding the timestamp by these two steps fulfills the order of all previous steps.
+        self.lower_steps = []
+        self.upper_steps = []
+        # Pairs (i, j) with timestamp_i <= timestamp_j that can be checked after each step
+        self.time_checks = []
+        for step in range(num_steps):
+            lower = [prev for prev in range(step) if order[prev] < order[step]]
+            upper = [prev for prev in range(step) if order[prev] > order[step]]
+            lower_step = max(lower, key=lambda prev: order[prev]) if lower else -1
+            upper_step = min(upper, key=lambda prev: order[prev]) if upper else -1
+            self.lower_steps.append(lower_step)
+            self.upper_steps.append(upper_step)
+            checks = []
+            if lower_step >= 0:
+                checks.append((lower_step, step))
+            if upper_step >= 0:
+                checks.append((step, upper_step))
+            self.time_checks.append(checks)
+
+        # Previous entity positions that have to be equal/different to each entity position
+        # Only the first position of each variable is compared.
+        self.equal_ents = [[] for _ in range(num_steps + 1)]
+        self.unequal_ents = [[] for _ in range(num_steps + 1)]
+        if self.var_constraints:
+            first_pos = list(range(num_steps + 1))
+            for constraint in self.var_constraints:
+                for idx in constraint:
+                    first_pos[idx] = min(constraint)
+            for pos in range(1, num_steps + 1):
+                for prev in sorted(set(first_pos[:pos])):
+                    if prev == first_pos[pos]:
+                        self.equal_ents[pos].append(prev)
+                    else:
+                        self.unequal_ents[pos].append(prev)
+
+    def timestamp_bounds(self, tss, max_ts):
+        """
+        Get the bounds for the timestamp of the next edge of partial groundings.
+
+        Parameters:
+            tss (list): timestamp arrays of the partial groundings, one array per previous step
+            max_ts (int): upper bound if no previous timestamp is higher in the order
+
+        Returns:
+            lower (np.ndarray): lower bounds (inclusive)
+            upper (np.ndarray): upper bounds (inclusive)
+        """
+
+        step = len(tss)
+        num = len(tss[0])
+        lower_step = self.lower_steps[step]
+        upper_step = self.upper_steps[step]
+        lower = tss[lower_step] if lower_step >= 0 else np.zeros(num, dtype=np.int64)
+        upper = tss[upper_step] if upper_step >= 0 else np.full(num, max_ts, dtype=np.int64)
+
+        return lower, upper
+
+    def entity_mask(self, ents):
+        """
+        Check if the last entity of partial groundings is equal to the previous entities
+        of the same variable and different from the previous entities of other variables.
+        Without variable constraints, all entities are allowed.
+
+        Parameters:
+            ents (list): entity arrays of the partial groundings, one array per position
+
+        Returns:
+            mask (np.ndarray): if the last entity fulfills the variable constraints
+        """
+
+        pos = len(ents) - 1
+        mask = np.ones(len(ents[pos]), dtype=bool)
+        for prev in self.equal_ents[pos]:
+            mask *= ents[prev] == ents[pos]
+        for prev in self.unequal_ents[pos]:
+            mask *= ents[prev] != ents[pos]
+
+        return mask
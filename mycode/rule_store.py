@@ -0,0 +1,232 @@
+import os
+import json
+import numpy as np
+from collections import Counter
+
+from rule import Rule, intern_body
+
+
+COLUMNS = [
+    "head_rels",
+    "conf",
+    "rule_supp",
+    "body_supp",
+    "num_samples",
+    "body_offsets",
+    "body_rels",
+    "timestamp_orders",
+    "var_ids",
+    "rel_keys",
+    "rel_offsets",
+]
+
+
+class Rule_Store(object):
+    def __init__(self, store_dir):
+        """
+        Rules in a columnar format, stored as one array per column in store_dir.
+        The arrays are memory-mapped, so that only the pages of the rules that are
+        used are read. The rules are grouped by head relation in the order of the
+        rules dict, and rel_offsets marks the start of each head relation's rules.
+        The body of rule i is body_rels[body_offsets[i]:body_offsets[i + 1]] (likewise
+        timestamp_orders), and its var_ids (the first entity position of the variable
+        of each entity position) start at body_offsets[i] + i.
+
+        Parameters:
+            store_dir (str): path to the store directory
+
+        Returns:
+            None
+        """
+
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as fin:
+            self.meta = json.load(fin)
+        for column in COLUMNS:
+            file = os.path.join(store_dir, column + ".npy")
+            setattr(self, column, np.load(file, mmap_mode="r") if os.path.exists(file) else None)
+
+    def __len__(self):
+        return len(self.head_rels)
+
+    def rule_lengths(self, idx):
+        """
+        Get the lengths of rules (read from the body offsets, no array for all rules).
+
+        Parameters:
+            idx (np.ndarray): indices of the rules
+
+        Returns:
+            lengths (np.ndarray): rule lengths
+        """
+
+        return self.body_offsets[idx + 1] - self.body_offsets[idx]
+
+    def select(self, min_conf=0, min_body_supp=0, rule_lengths=None, head_rels=None):
+        """
+        Select the rules with a minimum confidence, minimum body support and specified
+        rule lengths (the same conditions as rule_application.filter_rules).
+
+        Parameters:
+            min_conf (float): minimum confidence value
+            min_body_supp (int): minimum body support value
+            rule_lengths (list): rule lengths (None - all lengths)
+            head_rels (list): only read the rules of these head relations (None - all)
+
+        Returns:
+            idx (np.ndarray): indices of the selected rules (in the order of the store)
+        """
+
+        if head_rels is None:
+            idx = np.arange(len(self))
+        else:
+            rels = np.unique(np.asarray(head_rels, dtype=np.int64))
+            pos = np.searchsorted(self.rel_keys, rels)
+            found = pos < len(self.rel_keys)
+            pos, rels = pos[found], rels[found]
+            pos = pos[self.rel_keys[pos] == rels]
+            idx = concat_ranges(self.rel_offsets[pos], self.rel_offsets[pos + 1])
+
+        mask = self.conf[idx] >= min_conf
+        mask *= self.body_supp[idx] >= min_body_supp
+        if rule_lengths is not None:
+            mask *= np.isin(self.rule_lengths(idx), rule_lengths)
+
+        return idx[mask]
+
+    def rules_dict(self, idx=None):
+        """
+        Get the rules as a dict {head relation: list of rules}.
+
+        Parameters:
+            idx (np.ndarray): indices of the rules, e.g., from self.select (None - all rules)
+
+        Returns:
+            rules_dict (dict): Rules for each head relation (with shared bodies)
+        """
+
+        idx = np.arange(len(self)) if idx is None else np.asarray(idx, dtype=np.int64)
+        # Read the columns of all rules at once instead of rule by rule
+        starts, ends = self.body_offsets[idx], self.body_offsets[idx + 1]
+        body_pos = concat_ranges(starts, ends)
+        body_rels = self.body_rels[body_pos].tolist()
+        orders = self.timestamp_orders[body_pos].tolist()
+        all_var_ids = self.var_ids[concat_ranges(starts + idx, ends + idx + 1)].tolist()
+        columns = [self.head_rels, self.conf, self.rule_supp, self.body_supp]
+        if self.num_samples is not None:
+            columns.append(self.num_samples)
+        columns = [column[idx].tolist() for column in columns]
+
+        rules_dict = dict()
+        bodies = dict()
+        body_start = 0
+        for num, length in enumerate((ends - starts).tolist()):
+            body_end = body_start + length
+            var_ids = all_var_ids[body_start + num : body_end + num + 1]
+            var_constraints = dict()
+            for pos, var_id in enumerate(var_ids):
+                var_constraints.setdefault(var_id, []).append(pos)
+            var_constraints = sorted([tuple(x) for x in var_constraints.values() if len(x) > 1])
+            body = (
+                tuple(body_rels[body_start:body_end]),
+                tuple(var_constraints),
+                tuple(orders[body_start:body_end]),
+            )
+            rule = Rule(
+                columns[0][num],
+                *intern_body(body, bodies),
+                columns[1][num],
+                columns[2][num],
+                columns[3][num],
+                columns[4][num] if self.num_samples is not None else None,
+            )
+            rules_dict.setdefault(rule.head_rel, []).append(rule)
+            body_start = body_end
+
+        return rules_dict
+
+    def statistics(self, idx=None):
+        """
+        Show statistics of the rules (like rule_learning.rules_statistics).
+
+        Parameters:
+            idx (np.ndarray): indices of the rules (None - all rules)
+
+        Returns:
+            None
+        """
+
+        idx = np.arange(len(self)) if idx is None else idx
+        print("Number of relations with rules: ", len(np.unique(self.head_rels[idx])))
+        print("Total number of rules: ", len(idx))
+        rule_lengths = Counter(self.rule_lengths(idx).tolist())
+        print("Number of rules by length: ", sorted(rule_lengths.items()))
+
+
+def save_rule_store(rules_dict, store_dir, meta=None):
+    """
+    Save the rules in the columnar format of Rule_Store.
+
+    Parameters:
+        rules_dict (dict): Rules for each head relation
+        store_dir (str): path to the store directory
+        meta (dict): parameters of the rules, e.g., rule lengths and number of walks
+
+    Returns:
+        None
+    """
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    rel_keys = sorted(rules_dict)
+    rules = [rule for rel in rel_keys for rule in rules_dict[rel]]
+    rel_counts = [len(rules_dict[rel]) for rel in rel_keys]
+
+    var_ids = []
+    for rule in rules:
+        ids = list(range(len(rule.body_rels) + 1))
+        for constraint in rule.var_constraints:
+            for pos in constraint:
+                ids[pos] = min(constraint)
+        var_ids += ids
+    columns = {
+        "head_rels": [rule.head_rel for rule in rules],
+        "conf": np.array([rule.conf for rule in rules], dtype=np.float64),
+        "rule_supp": [rule.rule_supp for rule in rules],
+        "body_supp": [rule.body_supp for rule in rules],
+        "body_offsets": np.cumsum([0] + [len(rule.body_rels) for rule in rules]),
+        "body_rels": [rel for rule in rules for rel in rule.body_rels],
+        "timestamp_orders": [x for rule in rules for x in rule.body_timestamp_order],
+        "var_ids": var_ids,
+        "rel_keys": rel_keys,
+        "rel_offsets": np.cumsum([0] + rel_counts),
+    }
+    if all(rule.num_samples is not None for rule in rules):
+        columns["num_samples"] = [rule.num_samples for rule in rules]
+    for column in COLUMNS:
+        file = os.path.join(store_dir, column + ".npy")
+        if column in columns:
+            np.save(file, np.asarray(columns[column], dtype=np.float64 if column == "conf" else np.int64))
+        elif os.path.exists(file):
+            os.remove(file)
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as fout:
+        json.dump(meta or dict(), fout)
+
+
+def concat_ranges(starts, ends):
+    """
+    Concatenate the ranges [start, end) of several starts and ends.
+
+    Parameters:
+        starts (np.ndarray): starts of the ranges
+        ends (np.ndarray): ends of the ranges (exclusive)
+
+    Returns:
+        positions (np.ndarray): positions in all ranges
+    """
+
+    counts = np.asarray(ends, dtype=np.int64) - starts
+    first = np.cumsum(counts) - counts
+    positions = np.repeat(starts - first, counts) + np.arange(np.sum(counts), dtype=np.int64)
+
+    return positions
@@ -6,14 +6,14 @@ def score1(rule, c=0):
     Calculate candidate score depending on the rule's confidence.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         c (int): constant for smoothing
 
     Returns:
         score (float): candidate score
     """
 
-    score = rule["rule_supp"] / (rule["body_supp"] + c)
+    score = rule.rule_supp / (rule.body_supp + c)
 
     return score
 
@@ -30,7 +30,7 @@ def score2(cands_walks, test_query_ts, lmbda, rule):
     Returns:
         score (float): candidate score
     """
-    body_timestamp_order = rule["body_timestamp_order"]
+    body_timestamp_order = rule.body_timestamp_order
     min_index = body_timestamp_order.index(min(body_timestamp_order))
 
     # max_cands_ts = max(cands_walks["timestamp_0"])
@@ -46,7 +46,7 @@ def score_12(rule, cands_walks, test_query_ts, lmbda, a):
     Combined score function.
 
     Parameters:
-        rule (dict): rule from rules_dict
+        rule (Rule): rule from rules_dict
         cands_walks (pd.DataFrame): walks leading to the candidate
         test_query_ts (int): test query timestamp
         lmbda (float): rate of exponential distribution
@@ -64,7 +64,7 @@ def score_ruleConfidence_timediffReward(rule, cands_walks, test_query_ts, a, alp
     return score
 
 def score_timediffReward(rule, cands_walks, test_query_ts, alpha, lambda1, lambda2,):
-    body_timestamp_order = rule["body_timestamp_order"]
+    body_timestamp_order = rule.body_timestamp_order
     min_index = body_timestamp_order.index(min(body_timestamp_order))
     max_cands_ts = max(cands_walks["timestamp_{}".format(min_index)])
 
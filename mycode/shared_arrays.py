@@ -0,0 +1,178 @@
+import os
+import atexit
+import signal
+import shutil
+import resource
+import threading
+import tempfile
+import numpy as np
+
+
+class Shared_Arrays(object):
+    def __init__(self, min_bytes=2 ** 20, min_shm_free=2 ** 31, use_shm=True):
+        """
+        Store large arrays once in memory-mapped files (in shared memory if available).
+        joblib sends memory-mapped arrays to the worker processes as file references,
+        so all workers attach the same pages instead of getting their own copy.
+        Like joblib, shared memory is only used if it has enough free space, otherwise
+        the files are stored in the default temporary directory. The files are removed
+        at the latest when the process exits, also after an error, an interrupt or a
+        SIGTERM (e.g., from a job scheduler).
+
+        Parameters:
+            min_bytes (int): minimum size of the arrays that are shared
+            min_shm_free (int): minimum free space in shared memory (/dev/shm)
+            use_shm (bool): use shared memory if possible (False - temporary directory,
+                            e.g., if there is only one process)
+
+        Returns:
+            None
+        """
+
+        self.min_bytes = min_bytes
+        shm_dir = None
+        if (
+            use_shm
+            and os.path.isdir("/dev/shm")
+            and shutil.disk_usage("/dev/shm").free >= min_shm_free
+        ):
+            shm_dir = "/dev/shm"
+        self.folder = tempfile.mkdtemp(prefix="temprule_", dir=shm_dir)
+        atexit.register(self.close)
+        if (
+            threading.current_thread() is threading.main_thread()
+            and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+        ):
+            signal.signal(signal.SIGTERM, exit_on_signal)
+        self.num_arrays = 0
+        self.num_bytes = 0
+
+    def share(self, obj, seen=None):
+        """
+        Replace the large arrays in the attributes of the object (and of the objects, dicts
+        and lists it contains) by read-only memory-mapped copies.
+        The arrays must not be changed in place afterwards.
+
+        Parameters:
+            obj (object): object, e.g., Grapher, Temporal_Walk, Rule_Learner or Edge_Index
+            seen (set): ids of the objects that have already been shared
+
+        Returns:
+            None
+        """
+
+        seen = set() if seen is None else seen
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, list):
+            items = enumerate(obj)
+        elif hasattr(obj, "__dict__"):
+            items = vars(obj).items()
+        else:
+            return
+
+        for key, value in list(items):
+            if isinstance(value, np.ndarray):
+                if value.nbytes >= self.min_bytes and not is_file_backed(value):
+                    if isinstance(obj, (dict, list)):
+                        obj[key] = self.share_array(value)
+                    else:
+                        setattr(obj, key, self.share_array(value))
+            elif isinstance(value, (dict, list)) or hasattr(value, "__dict__"):
+                self.share(value, seen)
+
+    def share_array(self, array):
+        """
+        Store the array in a file and map it into memory.
+
+        Parameters:
+            array (np.ndarray): array
+
+        Returns:
+            shared_array (np.memmap): read-only memory-mapped array
+        """
+
+        file = os.path.join(self.folder, "{0}.npy".format(self.num_arrays))
+        np.save(file, array)
+        self.num_arrays += 1
+        self.num_bytes += array.nbytes
+
+        return np.load(file, mmap_mode="r")
+
+    def close(self):
+        """
+        Remove the files of the shared arrays.
+        Arrays that are still mapped stay valid until they are released.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+
+        shutil.rmtree(self.folder, ignore_errors=True)
+        atexit.unregister(self.close)
+
+
+def exit_on_signal(signum, frame):
+    """
+    Exit the process normally on a signal, so that the atexit functions are run.
+
+    Parameters:
+        signum (int): signal number
+        frame (frame): current stack frame
+
+    Returns:
+        None
+    """
+
+    raise SystemExit(128 + signum)
+
+
+def is_file_backed(array):
+    """
+    Check if the array is a (view of a) memory-mapped array.
+
+    Parameters:
+        array (np.ndarray): array
+
+    Returns:
+        file_backed (bool): if the array is memory-mapped
+    """
+
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base if isinstance(array.base, np.ndarray) else None
+
+    return False
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of the current process.
+    Pages of shared arrays are counted in every process that has touched them.
+
+    Parameters:
+        None
+
+    Returns:
+        peak_rss (int): peak resident set size in MB
+    """
+
+    # The high-water mark of a new process from joblib starts at zero, unlike ru_maxrss,
+    # which also contains the memory of the parent process before exec.
+    try:
+        with open("/proc/self/status") as fin:
+            for line in fin:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
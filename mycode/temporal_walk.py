@@ -1,8 +1,15 @@
+import sys
+import math
 import numpy as np
+from collections import OrderedDict
+
+from edge_index import Edge_Index, search_ranges
 
 
 class Temporal_Walk(object):
-    def __init__(self, learn_data, inv_relation_id, transition_distr):
+    def __init__(
+        self, learn_data, inv_relation_id, transition_distr, cycle_check="none", dead_end_cache_size=0
+    ):
         """
         Initialize temporal random walk object.
 
@@ -12,6 +19,13 @@ class Temporal_Walk(object):
             transition_distr (str): transition distribution
                                     "unif" - uniform distribution
                                     "exp"  - exponential distribution
+            cycle_check (str): use of the cycle-closing reachability before the last step
+                               "none"   - no check
+                               "reject" - stop walks that cannot return to the start node
+                               "steer"  - only sample edges from which the walk can return
+                                          to the start node
+            dead_end_cache_size (int): maximum number of states without a valid next edge
+                                       that are remembered (least recently used are removed)
 
         Returns:
             None
@@ -20,8 +34,100 @@ class Temporal_Walk(object):
         self.learn_data = learn_data
         self.inv_relation_id = inv_relation_id
         self.transition_distr = transition_distr
-        self.neighbors = store_neighbors(learn_data)
+        self.neighbors = store_neighbors(learn_data, sort_by_time=True)
         self.edges = store_edges(learn_data)
+        # Edges between two nodes sorted by time (for the last step of a walk)
+        self.pair_edges = Edge_Index(learn_data, key_col=(0, 2), sort_col=3)
+        self.inv_relations = np.array(
+            [inv_relation_id[rel] for rel in range(len(inv_relation_id))], dtype=np.int64
+        )
+        self.inverse_edge_ids = store_inverse_edge_ids(learn_data, self.inv_relations)
+        if transition_distr == "exp":
+            self.neighbors.store_log_weights()
+            self.pair_edges.store_log_weights()
+        self.cycle_check = cycle_check
+        if cycle_check != "none":
+            # Earliest timestamp of the edges between two nodes, a walk can return from a
+            # node to the start node iff there is an edge before the start timestamp
+            self.first_pair_ts = self.pair_edges.sort_values[self.pair_edges.offsets[:-1]]
+        self.start_edges = self.edges  # Edges from which the walks start
+        self.start_edge_ids = None  # Ids of the start edges if they are a subset of the edges
+        self.min_ts = 0  # Only the edges from this timestamp on are used (learning window)
+        self.num_walks = 0
+        self.num_successful_walks = 0
+        # Dead ends (node, start timestamp, step > 1, required closing node or -1)
+        self.dead_end_cache_size = dead_end_cache_size
+        self.dead_ends = OrderedDict()
+        self.dead_end_lookups = 0
+        self.dead_end_hits = 0
+
+    def set_start_edges(self, edge_ids):
+        """
+        Only start the walks from a subset of the edges, e.g., from new edges.
+
+        Parameters:
+            edge_ids (np.ndarray): ids of the start edges (rows in learn_data)
+
+        Returns:
+            None
+        """
+
+        self.start_edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        self.start_edges = Edge_Index(self.learn_data[self.start_edge_ids], key_col=1, sort_col=3)
+
+    def set_window(self, min_ts):
+        """
+        Only use the edges from min_ts on (learning window) for the start edges and all
+        steps of the walks. The start edges of each relation are sorted by time once, so
+        that the start edges in the window are a slice of their segment (like the
+        neighbors in the time-sorted indexes).
+
+        Parameters:
+            min_ts (int): first timestamp of the window
+
+        Returns:
+            None
+        """
+
+        self.min_ts = min_ts
+        if self.start_edges.sort_col is None:
+            self.start_edges = Edge_Index(self.learn_data, key_col=1, sort_col=3)
+
+    def start_segment(self, rel_idx):
+        """
+        Get the positions of the start edges of a relation in self.start_edges.
+
+        Parameters:
+            rel_idx (int): relation index
+
+        Returns:
+            start (int): start of the start edges
+            end (int): end of the start edges (exclusive)
+        """
+
+        start, end = self.start_edges.segment(rel_idx)
+        if self.min_ts:
+            start = self.start_edges.search(rel_idx, self.min_ts)[1]
+
+        return start, end
+
+    def num_start_edges(self, rel_idx):
+        """
+        Get the number of start edges of a relation.
+
+        Parameters:
+            rel_idx (int): relation index
+
+        Returns:
+            num_start_edges (int): number of start edges (0 if the relation has no edges)
+        """
+
+        try:
+            start, end = self.start_segment(rel_idx)
+        except KeyError:
+            return 0
+
+        return int(end - start)
 
     def sample_start_edge(self, rel_idx):
         """
@@ -32,76 +138,229 @@ class Temporal_Walk(object):
 
         Returns:
             start_edge (np.ndarray): start edge
+            start_edge_id (int): id of the start edge (row in learn_data)
         """
 
-        rel_edges = self.edges[rel_idx]
-        start_edge = rel_edges[np.random.choice(len(rel_edges))]
+        start, end = self.start_segment(rel_idx)
+        pos = start + np.random.choice(end - start)
+        start_edge = self.start_edges.quads[pos]
+        start_edge_id = self.start_edges.order[pos]
+        if self.start_edge_ids is not None:
+            start_edge_id = self.start_edge_ids[start_edge_id]
 
-        return start_edge
+        return start_edge, start_edge_id
 
-    def sample_next_edge(self, filtered_edges, cur_ts, delta, delta_list):
+    def sample_next_edge(self, index, start, end, exclude_pos, delta, delta_list, seg_start=None):
         """
         Define next edge distribution.
 
         Parameters:
-            filtered_edges (np.ndarray): filtered (according to time) edges
-            cur_ts (int): current timestamp
+            index (Edge_Index): time-sorted edge index
+            start (int): start of the filtered (according to time) edges in the index
+            end (int): end of the filtered edges in the index (exclusive)
+            exclude_pos (int): position of an edge in the index that must not be sampled
+                               (-1 if all filtered edges are allowed)
+            delta (float): upper quantile of the edges from which the next edge is sampled
+            delta_list (list): list of deltas
+            seg_start (int): start of the segment that contains the filtered edges
+                             (None - equal to start)
 
         Returns:
-            next_edge (np.ndarray): next edge
+            next_pos (int): position of the next edge in the index, -1 if there is no edge
         """
 
+        exclude = start <= exclude_pos < end
+        index_min, index_max = self.delta_range(end - start - exclude, delta, delta_list)
+        if index_max <= index_min:
+            return -1
 
-        if len(filtered_edges) <= 4:
-            next_edge = filtered_edges[np.random.choice(len(filtered_edges))]
-        else:
+        if self.transition_distr == "unif":
+            next_pos = start + index_min + np.random.choice(index_max - index_min)
+            if exclude and next_pos >= exclude_pos:
+                next_pos += 1  # Skip the excluded edge
+        elif self.transition_distr == "exp":
+            lo = start + index_min
+            hi = start + index_max
+            if exclude:
+                lo += lo >= exclude_pos
+                hi += hi - 1 >= exclude_pos
+            seg_start = start if seg_start is None else seg_start
+            next_pos = self.sample_exp_edge(index, seg_start, lo, hi, exclude_pos)
+
+        return next_pos
+
+    def delta_range(self, num_edges, delta, delta_list):
+        """
+        Get the range of the delta quantile of the time-sorted filtered edges.
+        If there are at most four edges, all edges are in the range.
+
+        Parameters:
+            num_edges (int): number of filtered edges
+            delta (float): upper quantile of the edges from which the next edge is sampled
+            delta_list (list): list of deltas
+
+        Returns:
+            index_min (int): start of the range
+            index_max (int): end of the range (exclusive)
+        """
+
+        index_min, index_max = 0, num_edges
+        if num_edges > 4:
             keys_list = list(delta_list)
-            if delta == keys_list[0]:
-                index_max = int(len(filtered_edges) * delta)
-                filtered_edges = filtered_edges[0:index_max]
-            elif delta == keys_list[1]:
-                index_min = int(len(filtered_edges) * keys_list[0])
-                index_max = int(len(filtered_edges) * delta)
-                filtered_edges = filtered_edges[index_min:index_max]
-            elif delta == keys_list[2]:
-                index_min = int(len(filtered_edges) * keys_list[1])
-                index_max = int(len(filtered_edges) * delta)
-                filtered_edges = filtered_edges[index_min:index_max]
-            elif delta == keys_list[3]:
-                index_min = int(len(filtered_edges) * keys_list[2])
-                index_max = int(len(filtered_edges) * delta)
-                filtered_edges = filtered_edges[index_min:index_max]
-
-
-        if len(filtered_edges) == 0:
-            return []
+            idx = keys_list.index(delta)
+            index_min = int(num_edges * keys_list[idx - 1]) if idx else 0
+            index_max = int(num_edges * delta)
+
+        return index_min, index_max
+
+    def can_close(self, nodes, start_nodes, start_ts):
+        """
+        Check if walks can return from the nodes to their start nodes, i.e., if there is an
+        edge from the node to the start node before the start timestamp (and in the window).
+        Requires cycle_check "reject" or "steer".
+
+        Parameters:
+            nodes (np.ndarray): current nodes
+            start_nodes (np.ndarray): start nodes
+            start_ts (np.ndarray): start timestamps
+
+        Returns:
+            closable (np.ndarray): if the walks can return to the start nodes
+        """
+
+        keys = self.pair_edges.multi_key(nodes, start_nodes)
+        if self.min_ts:
+            lo, hi = self.pair_edges.search_range_batch(keys, self.min_ts, start_ts - 1)
+            return hi > lo
+        pos = self.pair_edges.positions(keys)
+        closable = (pos >= 0) * (self.first_pair_ts[np.maximum(pos, 0)] < start_ts)
+
+        return closable
+
+    def sample_closable_edge(self, index, start, end, exclude_pos, start_node, start_ts, delta, delta_list):
+        """
+        Sample the next edge (see self.sample_next_edge) only among the edges whose object
+        can return to the start node.
+
+        Parameters:
+            index (Edge_Index): time-sorted edge index
+            start (int): start of the filtered (according to time) edges in the index
+            end (int): end of the filtered edges in the index (exclusive)
+            exclude_pos (int): position of an edge in the index that must not be sampled
+            start_node (int): start node
+            start_ts (int): start timestamp
+            delta (float): upper quantile of the edges from which the next edge is sampled
+            delta_list (list): list of deltas
+
+        Returns:
+            next_pos (int): position of the next edge in the index, -1 if there is no edge
+        """
+
+        exclude = start <= exclude_pos < end
+        index_min, index_max = self.delta_range(end - start - exclude, delta, delta_list)
+        positions = start + np.arange(index_min, index_max)
+        if exclude:
+            positions += positions >= exclude_pos
+        positions = positions[self.can_close(index.quads[positions, 2], start_node, start_ts)]
+        if not len(positions):
+            return -1
 
         if self.transition_distr == "unif":
-            next_edge = filtered_edges[np.random.choice(len(filtered_edges))]
+            next_pos = positions[np.random.choice(len(positions))]
         elif self.transition_distr == "exp":
+            tss = index.sort_values[positions]
+            prob = np.exp(tss - tss[-1])  # Relative to the newest edge
+            next_pos = positions[np.random.choice(len(positions), p=prob / np.sum(prob))]
 
+        return next_pos
 
-            tss = filtered_edges[:, 3]
-            prob = np.exp(tss - cur_ts)
-            try:
-                prob = prob / np.sum(prob)
-                next_edge = filtered_edges[
-                    np.random.choice(range(len(filtered_edges)), p=prob)
-                ]
-            except ValueError:  # All timestamps are far away
-                next_edge = filtered_edges[np.random.choice(len(filtered_edges))]
+    def sample_exp_edge(self, index, seg_start, lo, hi, exclude_pos):
+        """
+        Sample an edge from a range of a time-sorted index with probabilities proportional
+        to exp(timestamp). The precomputed cumulative log-weights of the index are used, so
+        sampling is a binary search and the probabilities never underflow.
 
-        return next_edge
+        Parameters:
+            index (Edge_Index): time-sorted edge index with log-weights
+            seg_start (int): start of the segment that contains the range
+            lo (int): start of the range
+            hi (int): end of the range (exclusive), hi > lo
+            exclude_pos (int): position of an edge that must not be sampled (-1 for none)
 
+        Returns:
+            next_pos (int): position of the sampled edge
+        """
 
-    def transition_step(self, cur_node, cur_ts, prev_edge, start_node, step, L, start_ts, next_delta, delta_list):
+        log_weights = index.log_cum_weights
+        top = log_weights[hi - 1]
+        # Shares of the weight of the edges before lo and of the excluded edge in the weight up to hi
+        below = math.exp(log_weights[lo - 1] - top) if lo > seg_start else 0.0
+        excl_below, excl_share = 0.0, 0.0
+        if lo <= exclude_pos < hi:
+            if exclude_pos > seg_start:
+                excl_below = math.exp(log_weights[exclude_pos - 1] - top)
+            excl_share = math.exp(log_weights[exclude_pos] - top) - excl_below
+
+        u = below + np.random.random() * (1 - below - excl_share)
+        if u >= excl_below:
+            u += excl_share  # Skip the excluded edge
+        next_pos = lo
+        if u > 0:
+            next_pos += np.searchsorted(log_weights[lo:hi], top + math.log(u), side="right")
+        next_pos = min(next_pos, hi - 1)
+        if next_pos == exclude_pos:  # Only possible by rounding
+            next_pos = next_pos + 1 if next_pos + 1 < hi else next_pos - 1
+
+        return next_pos
+
+    def sample_exp_edges(self, index, seg_starts, lo, hi, exclude_pos):
+        """
+        Sample edges from several ranges of a time-sorted index at once, see self.sample_exp_edge.
+
+        Parameters:
+            index (Edge_Index): time-sorted edge index with log-weights
+            seg_starts (np.ndarray): starts of the segments that contain the ranges
+            lo (np.ndarray): starts of the ranges
+            hi (np.ndarray): ends of the ranges (exclusive), hi > lo
+            exclude_pos (np.ndarray): positions of edges that must not be sampled (-1 for none)
+
+        Returns:
+            next_pos (np.ndarray): positions of the sampled edges
+        """
+
+        log_weights = index.log_cum_weights
+        top = log_weights[hi - 1]
+
+        def cum_share(pos):
+            # Share of the weight of the edges in [seg_start, pos) in the weight up to hi
+            return np.where(pos > seg_starts, np.exp(log_weights[pos - 1] - top), 0)
+
+        below = cum_share(lo)
+        exclude = (exclude_pos >= lo) * (exclude_pos < hi)
+        excl_pos = np.where(exclude, exclude_pos, lo)
+        excl_below = cum_share(excl_pos)
+        excl_share = np.where(exclude, np.exp(log_weights[excl_pos] - top) - excl_below, 0)
+
+        u = below + np.random.random(len(lo)) * (1 - below - excl_share)
+        u += exclude * (u >= excl_below) * excl_share  # Skip the excluded edge
+        with np.errstate(divide="ignore"):
+            targets = top + np.log(u)
+        next_pos = np.minimum(search_ranges(log_weights, lo, hi, targets), hi - 1)
+        # Rounding may still hit the excluded edge
+        on_excluded = exclude * (next_pos == exclude_pos)
+        next_pos = np.where(on_excluded * (next_pos + 1 < hi), next_pos + 1, next_pos)
+        next_pos = np.where(on_excluded * (next_pos == exclude_pos), next_pos - 1, next_pos)
+
+        return next_pos
+
+    def transition_step(self, cur_node, cur_ts, prev_edge_id, start_node, step, L, start_ts, next_delta, delta_list):
         """
         Sample a neighboring edge given the current node and timestamp.
 
         Parameters:
             cur_node (int): current node
             cur_ts (int): current timestamp
-            prev_edge (np.ndarray): previous edge
+            prev_edge_id (int): id of the previous edge
             start_node (int): start node
             step (int): number of current step
             L (int): length of random walk
@@ -110,31 +369,94 @@ class Temporal_Walk(object):
             delta_list (list): list of deltas
         Returns:
             next_edge (np.ndarray): next edge
+            next_edge_id (int): id of the next edge
         """
 
-        next_edges = self.neighbors[cur_node]
-
-        if step == 1:
-            filtered_edges = next_edges[next_edges[:, 3] < start_ts]
-        else:
-            filtered_edges = next_edges[next_edges[:, 3] < start_ts]
-            inv_edge = [
-                cur_node,
-                self.inv_relation_id[prev_edge[1]],
-                prev_edge[0],
-                cur_ts,
-            ]
-            row_idx = np.where(np.all(filtered_edges == inv_edge, axis=1))
-            filtered_edges = np.delete(filtered_edges, row_idx, axis=0)
-
+        # The last step has to return to the start node, use the edges between both nodes
         if step == L - 1:
-            filtered_edges = filtered_edges[filtered_edges[:, 2] == start_node]
-        if len(filtered_edges):
-            next_edge = self.sample_next_edge(filtered_edges, cur_ts, next_delta, delta_list)
+            index, key = self.pair_edges, (cur_node, start_node)
+            state = (int(cur_node), int(start_ts), step > 1, int(start_node))
+        else:
+            index, key = self.neighbors, cur_node
+            state = (int(cur_node), int(start_ts), step > 1, -1)
+        if self.dead_end_cache_size:
+            self.dead_end_lookups += 1
+            if state in self.dead_ends:
+                self.dead_end_hits += 1
+                self.dead_ends.move_to_end(state)
+                return [], -1
+
+        try:
+            # Binary search in the time-sorted edges instead of masking all of them
+            start, end = index.search(key, start_ts)
+        except KeyError:
+            self.add_dead_end(state)
+            return [], -1
+        seg_start = start
+        if self.min_ts:
+            start = index.search(key, self.min_ts)[1]  # Only the edges in the window
+
+        exclude_pos = -1
+        if step > 1:
+            # Do not walk back along the inverse of the previous edge
+            inv_edge_id = self.inverse_edge_ids[prev_edge_id]
+            if inv_edge_id >= 0:
+                exclude_pos = index.edge_positions[inv_edge_id]
+        excluded = start <= exclude_pos < end
+        if end - start - excluded <= 0:
+            # The inverse edge is always among the neighbors, but only sometimes among the
+            # edges to the start node (then it is not a dead end for every previous edge)
+            if not excluded or index is self.neighbors:
+                self.add_dead_end(state)
+            return [], -1
+
+        steer = self.cycle_check == "steer" and step == L - 2
+        if steer:
+            next_pos = self.sample_closable_edge(
+                index, start, end, exclude_pos, start_node, start_ts, next_delta, delta_list
+            )
         else:
-            next_edge = []
+            next_pos = self.sample_next_edge(
+                index, start, end, exclude_pos, next_delta, delta_list, seg_start
+            )
+        if next_pos < 0:
+            return [], -1
+        if self.cycle_check == "reject" and step == L - 2:
+            if not self.can_close(index.quads[next_pos, 2], start_node, start_ts):
+                return [], -1
+
+        return index.quads[next_pos], index.order[next_pos]
+
+    def add_dead_end(self, state):
+        """
+        Remember a state without a valid next edge.
 
-        return next_edge
+        Parameters:
+            state (tuple): (node, start timestamp, step > 1, required closing node or -1)
+
+        Returns:
+            None
+        """
+
+        if self.dead_end_cache_size:
+            self.dead_ends[state] = True
+            if len(self.dead_ends) > self.dead_end_cache_size:
+                self.dead_ends.popitem(last=False)
+
+    def dead_end_cache_memory(self):
+        """
+        Estimate the memory used by the dead-end cache.
+
+        Parameters:
+            None
+
+        Returns:
+            num_bytes (int): approximate number of bytes
+        """
+
+        entry_size = sys.getsizeof((0, 0, True, 0)) + 3 * sys.getsizeof(2 ** 20)
+
+        return sys.getsizeof(self.dead_ends) + len(self.dead_ends) * entry_size
 
     def sample_walk(self, L, rel_idx, delta_now, delta_list):
         """
@@ -153,7 +475,7 @@ class Temporal_Walk(object):
 
         walk_successful = True
         walk = dict()
-        prev_edge = self.sample_start_edge(rel_idx)
+        prev_edge, prev_edge_id = self.sample_start_edge(rel_idx)
         start_node = prev_edge[0]
         cur_node = prev_edge[2]
         cur_ts = prev_edge[3]
@@ -164,10 +486,8 @@ class Temporal_Walk(object):
         walk["timestamps"] = [cur_ts]
 
         for step in range(1, L):
-
-
-            next_edge = self.transition_step(
-                cur_node, cur_ts, prev_edge, start_node, step, L, start_ts, delta_now, delta_list
+            next_edge, next_edge_id = self.transition_step(
+                cur_node, cur_ts, prev_edge_id, start_node, step, L, start_ts, delta_now, delta_list
             )
 
             if len(next_edge):
@@ -176,29 +496,181 @@ class Temporal_Walk(object):
                 walk["relations"].append(next_edge[1])
                 walk["entities"].append(cur_node)
                 walk["timestamps"].append(cur_ts)
-                prev_edge = next_edge
+                prev_edge_id = next_edge_id
             else:
                 walk_successful = False
                 break
 
+        self.num_walks += 1
+        self.num_successful_walks += walk_successful
+
         return walk_successful, walk
 
+    def sample_batch_positions(self, index, starts, index_min, index_max, exclude_pos, seg_starts=None):
+        """
+        Sample the next edges of a batch of walks from the delta quantiles of their
+        filtered edges, see self.sample_next_edge.
 
-def store_neighbors(quads):
+        Parameters:
+            index (Edge_Index): time-sorted edge index
+            starts (np.ndarray): starts of the filtered edges in the index
+            index_min (np.ndarray): starts of the delta quantiles (relative to starts)
+            index_max (np.ndarray): ends of the delta quantiles (exclusive), index_max > index_min
+            exclude_pos (np.ndarray): positions of edges that must not be sampled (-1 for none)
+            seg_starts (np.ndarray): starts of the segments that contain the filtered edges
+                                     (None - equal to starts)
+
+        Returns:
+            next_pos (np.ndarray): positions of the next edges in the index
+        """
+
+        if self.transition_distr == "unif":
+            next_pos = starts + index_min
+            next_pos += (np.random.random(len(starts)) * (index_max - index_min)).astype(np.int64)
+            next_pos += (exclude_pos >= starts) * (next_pos >= exclude_pos)  # Skip the excluded edge
+        elif self.transition_distr == "exp":
+            exclude = exclude_pos >= starts
+            lo = starts + index_min
+            hi = starts + index_max
+            lo += exclude * (lo >= exclude_pos)
+            hi += exclude * (hi - 1 >= exclude_pos)
+            seg_starts = starts if seg_starts is None else seg_starts
+            next_pos = self.sample_exp_edges(index, seg_starts, lo, hi, exclude_pos)
+
+        return next_pos
+
+    def sample_walks(self, L, rel_idx, deltas, delta_list, max_tries=10):
+        """
+        Try to sample a batch of cyclic temporal random walks of length L at once.
+        All walks are advanced together with array operations, walks without a valid
+        next edge are dropped from the batch.
+
+        Parameters:
+            L (int): length of random walks
+            rel_idx (int): relation index
+            deltas (np.ndarray): delta for each walk
+            delta_list (list): list of deltas
+            max_tries (int): maximum number of samples for the second to last step
+                             with cycle_check "steer"
+
+        Returns:
+            walks_successful (np.ndarray): if the cyclic temporal random walks have been
+                                           successfully sampled
+            walks (list): information about the successful walks (same format as in self.sample_walk)
+        """
+
+        num_walks = len(deltas)
+        keys_list = list(delta_list)
+        lower_deltas = dict(zip(keys_list, [0] + keys_list[:-1]))
+        upper = np.asarray(deltas, dtype=np.float64)
+        lower = np.array([lower_deltas[delta] for delta in deltas], dtype=np.float64)
+
+        start, end = self.start_segment(rel_idx)
+        start_pos = start + np.random.choice(end - start, num_walks)
+        start_edges = self.start_edges.quads[start_pos]
+        prev_edge_ids = self.start_edges.order[start_pos]
+        if self.start_edge_ids is not None:
+            prev_edge_ids = self.start_edge_ids[prev_edge_ids]
+        entities = np.zeros((num_walks, L + 1), dtype=np.int64)
+        relations = np.zeros((num_walks, L), dtype=np.int64)
+        timestamps = np.zeros((num_walks, L), dtype=np.int64)
+        entities[:, 0:2] = start_edges[:, [0, 2]]
+        relations[:, 0] = start_edges[:, 1]
+        timestamps[:, 0] = start_edges[:, 3]
+
+        active = np.arange(num_walks)
+        for step in range(1, L):
+            cur_nodes = entities[active, step]
+            start_ts = timestamps[active, 0]
+            if step == L - 1:
+                index = self.pair_edges
+                keys = index.multi_key(cur_nodes, entities[active, 0])
+            else:
+                index = self.neighbors
+                keys = cur_nodes
+            starts, ends = index.search_batch(keys, start_ts)
+            seg_starts = starts
+            if self.min_ts:  # Only the edges in the window
+                starts = index.search_batch(keys, np.full(len(keys), self.min_ts))[1]
+
+            exclude_pos = np.full(len(active), -1)
+            if step > 1:
+                # Do not walk back along the inverse of the previous edge
+                inv_edge_ids = self.inverse_edge_ids[prev_edge_ids]
+                exclude_pos = np.where(
+                    inv_edge_ids >= 0, index.edge_positions[inv_edge_ids], -1
+                )
+            exclude = (exclude_pos >= starts) * (exclude_pos < ends)
+
+            num_edges = ends - starts - exclude
+            bucket = num_edges > 4  # Sample from the delta quantile of the edges
+            index_min = np.where(bucket, (num_edges * lower[active]).astype(np.int64), 0)
+            index_max = np.where(bucket, (num_edges * upper[active]).astype(np.int64), num_edges)
+            sizes = index_max - index_min
+
+            found = sizes > 0
+            active = active[found]
+            starts, exclude_pos = starts[found], exclude_pos[found]
+            seg_starts = seg_starts[found]
+            index_min, index_max = index_min[found], index_max[found]
+            next_pos = self.sample_batch_positions(
+                index, starts, index_min, index_max, exclude_pos, seg_starts
+            )
+
+            if self.cycle_check != "none" and step == L - 2:
+                start_nodes, start_ts = entities[active, 0], timestamps[active, 0]
+                closable = self.can_close(index.quads[next_pos, 2], start_nodes, start_ts)
+                for _ in range(max_tries - 1 if self.cycle_check == "steer" else 0):
+                    retry = np.flatnonzero(~closable)
+                    if not len(retry):
+                        break
+                    next_pos[retry] = self.sample_batch_positions(
+                        index,
+                        starts[retry],
+                        index_min[retry],
+                        index_max[retry],
+                        exclude_pos[retry],
+                        seg_starts[retry],
+                    )
+                    closable[retry] = self.can_close(
+                        index.quads[next_pos[retry], 2], start_nodes[retry], start_ts[retry]
+                    )
+                active = active[closable]
+                next_pos = next_pos[closable]
+
+            prev_edge_ids = index.order[next_pos]
+            next_edges = index.quads[next_pos]
+            entities[active, step + 1] = next_edges[:, 2]
+            relations[active, step] = next_edges[:, 1]
+            timestamps[active, step] = next_edges[:, 3]
+
+        walks_successful = np.zeros(num_walks, dtype=bool)
+        walks_successful[active] = True
+        self.num_walks += num_walks
+        self.num_successful_walks += len(active)
+        walks = [
+            {"entities": ents, "relations": rels, "timestamps": tss}
+            for ents, rels, tss in zip(
+                entities[active].tolist(), relations[active].tolist(), timestamps[active].tolist()
+            )
+        ]
+
+        return walks_successful, walks
+
+
+def store_neighbors(quads, sort_by_time=False):
     """
     Store all neighbors (outgoing edges) for each node.
 
     Parameters:
         quads (np.ndarray): indices of quadruples
+        sort_by_time (bool): sort the neighbors of each node by timestamp
 
     Returns:
-        neighbors (dict): neighbors for each node
+        neighbors (Edge_Index): neighbors for each node
     """
 
-    neighbors = dict()
-    nodes = list(set(quads[:, 0]))
-    for node in nodes:
-        neighbors[node] = quads[quads[:, 0] == node]
+    neighbors = Edge_Index(quads, key_col=0, sort_col=3 if sort_by_time else None)
 
     return neighbors
 
@@ -211,12 +683,42 @@ def store_edges(quads):
         quads (np.ndarray): indices of quadruples
 
     Returns:
-        edges (dict): edges for each relation
+        edges (Edge_Index): edges for each relation
     """
 
-    edges = dict()
-    relations = list(set(quads[:, 1]))
-    for rel in relations:
-        edges[rel] = quads[quads[:, 1] == rel]
+    edges = Edge_Index(quads, key_col=1)
 
     return edges
+
+
+def store_inverse_edge_ids(quads, inv_relations):
+    """
+    Store the id of the inverse edge for each edge.
+    The id of an edge is its row in quads.
+
+    Parameters:
+        quads (np.ndarray): indices of quadruples
+        inv_relations (np.ndarray): inverse relation for each relation
+
+    Returns:
+        inverse_edge_ids (np.ndarray): id of the inverse edge for each edge, -1 if the
+                                       inverse edge does not exist
+    """
+
+    if not len(quads):
+        return np.zeros(0, dtype=np.int64)
+
+    num_entities = max(quads[:, 0].max(), quads[:, 2].max()) + 1
+    dims = (num_entities, len(inv_relations), num_entities, quads[:, 3].max() + 1)
+    keys = np.ravel_multi_index(quads.T, dims)
+    inv_quads = np.column_stack(
+        (quads[:, 2], inv_relations[quads[:, 1]], quads[:, 0], quads[:, 3])
+    )
+    inv_keys = np.ravel_multi_index(inv_quads.T, dims)
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pos = np.minimum(np.searchsorted(sorted_keys, inv_keys), len(keys) - 1)
+    inverse_edge_ids = np.where(sorted_keys[pos] == inv_keys, order[pos], -1)
+
+    return inverse_edge_ids
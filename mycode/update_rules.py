@@ -0,0 +1,136 @@
+import os
+import time
+import json
+import argparse
+import numpy as np
+from datetime import datetime
+
+from grapher import Grapher
+from temporal_walk import Temporal_Walk
+from rule import intern_body, rules_from_dicts
+from rule_store import Rule_Store
+from rule_learning import Rule_Learner, rule_key, body_key, rules_statistics
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dataset", "-d", default="", type=str)
+parser.add_argument("--rules", "-r", default="", type=str)
+parser.add_argument("--new_facts", default="new.txt", type=str)
+parser.add_argument("--rule_lengths", "-l", default="3", type=int, nargs="+")
+parser.add_argument("--num_walks", "-n", default="100", type=int)  # Per relation of the new facts
+parser.add_argument("--transition_distr", default="unif", type=str)
+parser.add_argument("--seed", "-s", default=None, type=int)
+parser.add_argument("--batch_size", "-b", default=0, type=int)  # 0: sample walks one by one
+parser.add_argument("--confidence", default="sample", type=str, choices=["sample", "exact", "adaptive"])
+parser.add_argument("--max_groundings", default=1000000, type=int)
+parser.add_argument("--conf_tolerance", default=0.05, type=float)
+parser.add_argument("--min_conf", default=0.0, type=float)
+parser.add_argument("--body_cache", default=256, type=int)  # MB, 0: no cache
+parsed = vars(parser.parse_args())
+
+dataset = parsed["dataset"]
+rules_file = parsed["rules"]
+rule_lengths = parsed["rule_lengths"]
+rule_lengths = [rule_lengths] if (type(rule_lengths) == int) else rule_lengths
+num_walks = parsed["num_walks"]
+transition_distr = parsed["transition_distr"]
+seed = parsed["seed"]
+batch_size = parsed["batch_size"]
+
+dataset_dir = "../data/" + dataset + "/"
+dir_path = "../output/" + dataset + "/"
+data = Grapher(dataset_dir)
+# The new facts must only contain known entities and relations (with the ids of the dataset),
+# new timestamps after the known ones get the next timestamp ids
+new_ts = data.add_timestamps(parsed["new_facts"])
+if new_ts:
+    print("New timestamps: {0} ({1} to {2})".format(len(new_ts), new_ts[0], new_ts[-1]))
+new_idx = data.create_store(parsed["new_facts"])
+learn_data = np.vstack((data.train_idx, new_idx))
+new_edge_ids = np.arange(len(data.train_idx), len(learn_data))
+new_relations = set(np.unique(new_idx[:, 1]).tolist())
+print("New facts: {0} edges of {1} relations".format(len(new_idx), len(new_relations)))
+
+start = time.time()
+temporal_walk = Temporal_Walk(learn_data, data.inv_relation_id, transition_distr)
+temporal_walk.set_start_edges(new_edge_ids)  # New walks only start from the new edges
+rl = Rule_Learner(
+    temporal_walk.edges,
+    data.id2relation,
+    data.inv_relation_id,
+    dataset,
+    parsed["confidence"],
+    parsed["max_groundings"],
+    parsed["conf_tolerance"],
+    parsed["min_conf"],
+    parsed["body_cache"] * 2 ** 20,
+    seed,
+)
+if os.path.isdir(dir_path + rules_file):
+    rules_dict = Rule_Store(dir_path + rules_file).rules_dict()
+else:
+    rules_dict = rules_from_dicts(json.load(open(dir_path + rules_file)))
+end = time.time()
+print("Index time: {0:.2f} s".format(end - start))
+
+# Re-estimate the rules whose head or body relations occur in the new facts,
+# the other rules have the same groundings as before
+start = time.time()
+num_updated = 0
+num_removed = 0
+for rel in sorted(rules_dict):
+    for rule in rules_dict[rel]:
+        intern_body(body_key(rule), rl.bodies)  # Share the bodies with the new rules
+        rl.found_rules.add(rule_key(rule))
+        if rel in new_relations or new_relations.intersection(rule.body_rels):
+            (
+                rule.conf,
+                rule.rule_supp,
+                rule.body_supp,
+                rule.num_samples,
+            ) = rl.calculate_confidence(rule)
+            num_updated += 1
+        if rule.conf:
+            rl.update_rules_dict(rule)
+        else:
+            num_removed += 1
+end = time.time()
+print(
+    "Re-estimated {0} rules ({1} removed) in {2:.2f} s".format(
+        num_updated, num_removed, end - start
+    )
+)
+
+# New walks from the new edges (new rules are added to rl.rules_dict by create_rule)
+start = time.time()
+num_rules = sum(len(rules) for rules in rl.rules_dict.values())
+np.random.seed(seed)
+for rel in sorted(new_relations):
+    for length in rule_lengths:
+        if not batch_size:
+            for _ in range(num_walks):
+                walk_successful, walk = temporal_walk.sample_walk(length + 1, rel, 1, [1])
+                if walk_successful:
+                    rl.create_rule(walk)
+            continue
+        for batch_start in range(0, num_walks, batch_size):
+            num_batch_walks = min(batch_size, num_walks - batch_start)
+            _, walks = temporal_walk.sample_walks(length + 1, rel, np.ones(num_batch_walks), [1])
+            for walk in walks:
+                rl.create_rule(walk)
+end = time.time()
+print(
+    "Sampled {0} walks, found {1} new rules in {2:.2f} s".format(
+        temporal_walk.num_walks,
+        sum(len(rules) for rules in rl.rules_dict.values()) - num_rules,
+        end - start,
+    )
+)
+
+rl.sort_rules_dict()
+dt = datetime.now()
+dt = dt.strftime("%Y%m%d%H%M%S")
+rl.save_rules(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_store(dt, rule_lengths, num_walks, transition_distr, seed)
+rl.save_rules_verbalized(dt, rule_lengths, num_walks, transition_distr, seed)
+rules_statistics(rl.rules_dict)
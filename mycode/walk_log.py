@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import numpy as np
+
+
+class Walk_Log(object):
+    def __init__(self, log_dir):
+        """
+        Binary log of the successful walks of a learning run, one file for each relation,
+        rule length and phase (see learn.task_seed). Each walk of a rule of length l is a
+        row of 3 * l + 5 int32 values: the number of the walk among the sampled walks of
+        the relation and rule length, the l + 2 entities, the l + 1 relations and the
+        l + 1 timestamps of the walk (in the format of Temporal_Walk.sample_walk).
+
+        Parameters:
+            log_dir (str): path to the log directory
+
+        Returns:
+            None
+        """
+
+        self.log_dir = log_dir
+        self.buffer = []
+
+    def log_file(self, rel, length, phase):
+        """
+        Get the log file of a relation, rule length and phase.
+
+        Parameters:
+            rel (int): relation index
+            length (int): rule length
+            phase (int): phase
+
+        Returns:
+            log_file (str): path to the log file
+        """
+
+        log_file = os.path.join(self.log_dir, "rel{0}_l{1}_p{2}.bin".format(rel, length, phase))
+
+        return log_file
+
+    def save_meta(self, meta):
+        """
+        Save the parameters of the learning run that are needed to replay the walks.
+
+        Parameters:
+            meta (dict): parameters, e.g., the training data and the learning window
+
+        Returns:
+            None
+        """
+
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, "meta.json"), "w", encoding="utf-8") as fout:
+            json.dump(meta, fout)
+
+    def load_meta(self):
+        """
+        Load the parameters of the learning run.
+
+        Parameters:
+            None
+
+        Returns:
+            meta (dict): parameters from self.save_meta
+        """
+
+        with open(os.path.join(self.log_dir, "meta.json"), encoding="utf-8") as fin:
+            meta = json.load(fin)
+
+        return meta
+
+    def add(self, walk_nums, walks):
+        """
+        Add walks to the buffer of the current task.
+
+        Parameters:
+            walk_nums (list): number of each walk among the sampled walks
+            walks (list): successful walks from Temporal_Walk.sample_walk(s)
+
+        Returns:
+            None
+        """
+
+        for num, walk in zip(walk_nums, walks):
+            self.buffer.append(
+                [num] + list(walk["entities"]) + list(walk["relations"]) + list(walk["timestamps"])
+            )
+
+    def flush(self, rel, length, phase):
+        """
+        Write the buffered walks of a task to its log file and clear the buffer.
+        The file is replaced atomically, so that an interrupted task never leaves
+        a partial log (the task is learned again with --resume).
+
+        Parameters:
+            rel (int): relation index
+            length (int): rule length
+            phase (int): phase
+
+        Returns:
+            None
+        """
+
+        records = np.array(self.buffer, dtype=np.int32).reshape(-1, 3 * length + 5)
+        file = self.log_file(rel, length, phase)
+        tmp_file = "{0}.{1}.tmp".format(file, os.getpid())
+        records.tofile(tmp_file)
+        os.replace(tmp_file, file)
+        self.buffer = []
+
+    def tasks(self):
+        """
+        Get the relations and rule lengths of the logged walks.
+
+        Parameters:
+            None
+
+        Returns:
+            tasks (list): sorted (relation, rule length) pairs
+        """
+
+        tasks = set()
+        for filename in os.listdir(self.log_dir):
+            match = re.match(r"rel(\d+)_l(\d+)_p\d+\.bin$", filename)
+            if match:
+                tasks.add((int(match.group(1)), int(match.group(2))))
+
+        return sorted(tasks)
+
+    def read(self, rel, length, max_walks=None):
+        """
+        Read the logged walks of a relation and rule length in the order of sampling.
+
+        Parameters:
+            rel (int): relation index
+            length (int): rule length
+            max_walks (int): only the walks among the first max_walks sampled walks
+                             (None - all walks)
+
+        Returns:
+            walks (list): walks in the format of Temporal_Walk.sample_walk
+        """
+
+        records = []
+        for phase in [0, 1]:
+            file = self.log_file(rel, length, phase)
+            if os.path.exists(file):
+                records.append(np.fromfile(file, dtype=np.int32).reshape(-1, 3 * length + 5))
+        if not records:
+            return []
+        records = np.vstack(records).astype(np.int64)
+        if max_walks is not None:
+            records = records[records[:, 0] < max_walks]
+
+        L = length + 1
+        walks = [
+            {"entities": ents, "relations": rels, "timestamps": tss}
+            for ents, rels, tss in zip(
+                records[:, 1 : L + 2].tolist(),
+                records[:, L + 2 : 2 * L + 2].tolist(),
+                records[:, 2 * L + 2 :].tolist(),
+            )
+        ]
+
+        return walks